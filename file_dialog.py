@@ -37,6 +37,12 @@ def test_quit(input):
     if input in ('esc',):
         raise urwid.ExitMainLoop()
 
-fd = FileDialog(ok_cb, cancel_cb)
-loop = urwid.MainLoop(fd, const_PALETTE, unhandled_input=test_quit)
-loop.run()
+loop = urwid.MainLoop(urwid.SolidFill(), const_PALETTE, unhandled_input=test_quit)
+#With the main loop, directories are scanned in background
+fd = FileDialog(ok_cb, cancel_cb, loop=loop)
+loop.widget = fd
+try:
+    loop.run()
+finally:
+    #the dialog is closed by Ok/Cancel, but not when we leave with 'esc'
+    fd.close()
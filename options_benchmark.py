@@ -0,0 +1,35 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Measure the memory used by ListOption, per option
+
+usage: options_benchmark.py [number of options]
+"""
+
+import sys
+import tracemalloc
+from urwid_satext.sat_widgets import ListOption
+
+
+def measure(options):
+    """Return the memory allocated by ListOption.fromOptions, per option"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    converted = ListOption.fromOptions(options)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del converted
+    return (after - before) / len(options)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    labels = ["option %d" % idx for idx in range(count)]
+    print("%d options, python %s" % (count, sys.version.split()[0]))
+    print("value == label: %d B/option" % measure(labels))
+    print("(value, label): %d B/option" % measure(list(enumerate(labels))))
+    print("100 distinct labels: %d B/option" % measure([labels[idx % 100] for idx in range(count)]))
+
+
+if __name__ == '__main__':
+    main()
@@ -20,9 +20,23 @@
 import urwid
 from . import sat_widgets
 import os, os.path
-from xml.dom import minidom
+import abc
+import collections
+import bisect
+import heapq
+import re
+import threading
+import queue
+import concurrent.futures
+import ctypes
+import ctypes.util
+import struct
+import fnmatch
+from stat import filemode, S_ISDIR, S_ISLNK
+from xml.etree.ElementTree import iterparse, ParseError
+from urllib.parse import unquote
 import logging as log
-from time import time
+from time import time, localtime, strftime
 from .keys import action_key_map as a_key
 
 import gettext
@@ -47,91 +61,1608 @@ class PathEdit(sat_widgets.AdvancedEdit):
         else:
             return super(PathEdit, self).keypress(size, key)
 
+FileEntry = collections.namedtuple('FileEntry', ('name', 'is_dir', 'inode'))
+SEPARATOR = None # row between directories and files
+
+
+def iterDirectory(path):
+    """Iterate on entries of a directory
+
+    d_type from the directory entries is used, so no stat is needed on most filesystems
+    @param path: path of the directory
+    @return (iterator): FileEntry instances
+    @raise OSError: the directory can't be listed
+    """
+    with os.scandir(path) as it:
+        for dir_entry in it:
+            filename = dir_entry.name
+            if not isinstance(filename, str):
+                log.warning("file [{}] has a badly encode filename, ignoring it".format(filename.decode('utf-8', 'replace')))
+                continue
+            try:
+                is_dir = dir_entry.is_dir()
+            except OSError:
+                is_dir = False
+            yield FileEntry(filename, is_dir, dir_entry.inode())
+
+
+def getEntry(directory, name):
+    """Return the entry of a file, as iterDirectory does
+
+    @param directory: path of the directory containing the file
+    @param name: name of the file
+    @return (FileEntry, None): entry, or None if the file doesn't exist
+    """
+    path = os.path.join(directory, name)
+    try:
+        stat = os.lstat(path)
+    except OSError:
+        return None
+    if S_ISLNK(stat.st_mode):
+        is_dir = os.path.isdir(path)
+    else:
+        is_dir = S_ISDIR(stat.st_mode)
+    return FileEntry(name, is_dir, stat.st_ino)
+
+
+def listDirectory(path):
+    """List entries of a directory
+
+    @param path: path of the directory
+    @return (tuple): (directories, files) sorted lists of FileEntry
+    @raise OSError: the directory can't be listed
+    """
+    directories = []
+    files = []
+    for entry in iterDirectory(path):
+        if entry.is_dir:
+            directories.append(entry)
+        else:
+            files.append(entry)
+    directories.sort()
+    files.sort()
+    return directories, files
+
+
+class DirectoryCache(object):
+    """Size bounded LRU cache of directories listings
+
+    A listing is only used if the directory has still the same inode, size and modification time.
+    Cached lists are shared and must not be modified.
+    """
+
+    def __init__(self, max_size=32):
+        """
+        @param max_size: maximum number of directories kept in cache
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._listings = collections.OrderedDict() # path => (stat key, directories, files)
+        self._lock = threading.Lock() # the cache is used by DirectoryScanner workers too
+
+    @staticmethod
+    def statKey(path):
+        """Return the data used to check that a listing is still valid
+
+        @raise OSError: path can't be accessed
+        """
+        stat = os.stat(path)
+        return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def lookup(self, path, stat_key=None):
+        """Return cached listing if it is still valid
+
+        @param path: path of the directory
+        @param stat_key: result of statKey if already known
+        @return (tuple, None): (directories, files) or None if cache is missed
+        @raise OSError: path can't be accessed
+        """
+        path = os.path.abspath(path)
+        if stat_key is None:
+            stat_key = self.statKey(path)
+        with self._lock:
+            try:
+                cached_key, directories, files = self._listings[path]
+            except KeyError:
+                cached_key = None
+            if cached_key != stat_key:
+                self.misses += 1
+                return None
+            self._listings.move_to_end(path)
+            self.hits += 1
+            return directories, files
+
+    def store(self, path, stat_key, directories, files):
+        """Put a listing in cache
+
+        @param stat_key: result of statKey, got *before* the directory was listed
+        @param directories: sorted list of directories FileEntry
+        @param files: sorted list of files FileEntry
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            self._listings[path] = (stat_key, directories, files)
+            self._listings.move_to_end(path)
+            while len(self._listings) > self.max_size:
+                self._listings.popitem(last=False)
+
+    def get(self, path):
+        """Return listing of a directory, from cache if possible
+
+        @param path: path of the directory
+        @return (tuple): (directories, files) sorted lists of FileEntry
+        @raise OSError: the directory can't be listed
+        """
+        stat_key = self.statKey(path)
+        listing = self.lookup(path, stat_key)
+        if listing is None:
+            listing = listDirectory(path)
+            self.store(path, stat_key, *listing)
+        return listing
+
+    def refresh(self, path):
+        """List a directory without using the cache, and update the cache
+
+        to use when the directory is known to have changed, as a change may happen
+        without changing the modification time (e.g. in the same tick)
+        @param path: path of the directory
+        @return (tuple): (directories, files) sorted lists of FileEntry
+        @raise OSError: the directory can't be listed
+        """
+        stat_key = self.statKey(path)
+        listing = listDirectory(path)
+        self.store(path, stat_key, *listing)
+        return listing
+
+    def invalidate(self, path=None):
+        """Remove a directory from cache
+
+        @param path: path of the directory, or None to clear the whole cache
+        """
+        with self._lock:
+            if path is None:
+                self._listings.clear()
+            else:
+                self._listings.pop(os.path.abspath(path), None)
+
+
+directory_cache = DirectoryCache()
+
+
+class LoopCaller(object):
+    """Call methods in urwid main loop from other threads"""
+
+    def __init__(self, loop):
+        """
+        @param loop: urwid main loop
+        """
+        self.loop = loop
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pipe = loop.watch_pipe(self._onPipeData)
+
+    def call(self, method, *args):
+        """Call method with args in the main loop, can be used from any thread
+
+        calls done after close are ignored
+        """
+        with self._lock:
+            if self._pipe is None:
+                return
+            self._queue.put((method, args))
+            os.write(self._pipe, b'.')
+
+    def close(self):
+        """Stop watching calls from other threads, and close the pipe"""
+        with self._lock:
+            if self._pipe is None:
+                return
+            self.loop.remove_watch_pipe(self._pipe)
+            # urwid only closes the read end
+            os.close(self._pipe)
+            self._pipe = None
+
+    def _onPipeData(self, data):
+        while True:
+            try:
+                method, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            method(*args)
+        return True
+
+
+class DirectoryScanner(object):
+    """List directories in a worker thread, and send entries by batches to the main loop
+
+    Only the last requested scan is reported, older ones are cancelled.
+    """
+    first_batch_size = 256 # batch size is doubled after each batch
+
+    def __init__(self, loop, on_start, on_entries, on_end, cache=directory_cache):
+        """
+        @param loop: urwid main loop
+        @param on_start: method called with the path when a directory scan starts
+        @param on_entries: method called with a list of FileEntry
+        @param on_end: method called when the scan is finished, with a boolean
+            which is True if the directory could not be listed
+        @param cache: DirectoryCache to use, or None to always list directories
+        """
+        self.loop = loop
+        self.cache = cache
+        self._on_start = on_start
+        self._on_entries = on_entries
+        self._on_end = on_end
+        self._scan_id = 0
+        self._caller = LoopCaller(loop)
+
+    def scan(self, path):
+        """Start scanning path, and cancel current scan if any"""
+        self._scan_id += 1
+        thread = threading.Thread(target=self._scan, args=(self._scan_id, path))
+        thread.daemon = True
+        thread.start()
+
+    def cancel(self):
+        """Cancel current scan, nothing more will be reported from it"""
+        self._scan_id += 1
+
+    def close(self):
+        """Cancel current scan and stop watching worker messages"""
+        self.cancel()
+        self._caller.close()
+
+    def _send(self, scan_id, method, *args):
+        """Send a message from the worker to the main loop"""
+        self._caller.call(self._deliver, scan_id, method, args)
+
+    def _deliver(self, scan_id, method, args):
+        if scan_id == self._scan_id:
+            method(*args)
+
+    def _scan(self, scan_id, path):
+        """Scan a directory, called in the worker thread"""
+        if not os.path.isdir(path):
+            return
+        self._send(scan_id, self._on_start, path)
+        stat_key = None
+        if self.cache is not None:
+            try:
+                stat_key = self.cache.statKey(path)
+                listing = self.cache.lookup(path, stat_key)
+            except OSError:
+                listing = None
+            if listing is not None:
+                directories, files = listing
+                self._send(scan_id, self._on_entries, directories + files)
+                self._send(scan_id, self._on_end, False)
+                return
+        entries = []
+        batch_start = 0
+        batch_size = self.first_batch_size
+        try:
+            for entry in iterDirectory(path):
+                if scan_id != self._scan_id:
+                    return
+                entries.append(entry)
+                if len(entries) - batch_start >= batch_size:
+                    self._send(scan_id, self._on_entries, entries[batch_start:])
+                    batch_start = len(entries)
+                    batch_size *= 2
+        except OSError:
+            self._send(scan_id, self._on_end, True)
+            return
+        if batch_start < len(entries):
+            self._send(scan_id, self._on_entries, entries[batch_start:])
+        self._send(scan_id, self._on_end, False)
+        if stat_key is not None:
+            directories = sorted(entry for entry in entries if entry.is_dir)
+            files = sorted(entry for entry in entries if not entry.is_dir)
+            self.cache.store(path, stat_key, directories, files)
+
+
+class StatFetcher(object):
+    """Get os.stat of files by batches in a thread pool
+
+    Results are cached per inode until clear is called (i.e. when an other directory is shown).
+    Without main loop, os.stat is called immediately.
+    """
+    batch_size = 64
+    max_workers = 4
+
+    def __init__(self, loop=None):
+        """
+        @param loop: urwid main loop, or None to stat synchronously
+        """
+        self.loop = loop
+        self._cache = {} # inode (or path if unknown) => os.stat_result or None
+        self._requests = {} # inode (or path) => (path, callbacks) for stat not received yet
+        self._to_fetch = []
+        self._generation = 0
+        self._flush_alarm = None
+        self._closed = False
+        if loop is not None:
+            self._caller = LoopCaller(loop)
+            self._executor = concurrent.futures.ThreadPoolExecutor(self.max_workers)
+
+    def clear(self):
+        """Forget cached and requested stats"""
+        self._generation += 1
+        self._cache.clear()
+        self._requests.clear()
+        del self._to_fetch[:]
+
+    def forget(self, path, inode):
+        """Forget the cached stat of a file which has changed
+
+        @param path: path of the file
+        @param inode: inode of the file, or None if unknown
+        """
+        self._cache.pop(path if inode is None else inode, None)
+
+    def close(self):
+        """Forget requests and stop the threads, later requests are ignored"""
+        if self._closed:
+            return
+        self._closed = True
+        self.clear()
+        if self.loop is not None:
+            if self._flush_alarm is not None:
+                self.loop.remove_alarm(self._flush_alarm)
+                self._flush_alarm = None
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._caller.close()
+
+    def request(self, path, inode, callback):
+        """Ask for the stat of a file
+
+        @param path: path of the file
+        @param inode: inode of the file, or None if unknown
+        @param callback: method called with os.stat_result, or None if the file can't be accessed
+        """
+        if self._closed:
+            return
+        key = path if inode is None else inode
+        try:
+            stat = self._cache[key]
+        except KeyError:
+            pass
+        else:
+            callback(stat)
+            return
+        if self.loop is None:
+            stat = self._cache[key] = statPath(path)
+            callback(stat)
+            return
+        try:
+            self._requests[key][1].append(callback)
+        except KeyError:
+            self._requests[key] = (path, [callback])
+            self._to_fetch.append(key)
+            if self._flush_alarm is None:
+                # we wait for the end of the current rendering to get all visible rows
+                self._flush_alarm = self.loop.set_alarm_in(0, self._flush)
+
+    def _flush(self, loop, user_data):
+        self._flush_alarm = None
+        to_fetch = [(key, self._requests[key][0]) for key in self._to_fetch]
+        del self._to_fetch[:]
+        for idx in range(0, len(to_fetch), self.batch_size):
+            self._executor.submit(self._statBatch, self._generation, to_fetch[idx:idx+self.batch_size])
+
+    def _statBatch(self, generation, batch):
+        """Stat a batch of files, called in a worker thread"""
+        results = [(key, statPath(path)) for key, path in batch]
+        self._caller.call(self._deliver, generation, results)
+
+    def _deliver(self, generation, results):
+        if generation != self._generation:
+            return
+        for key, stat in results:
+            self._cache[key] = stat
+            path, callbacks = self._requests.pop(key, (None, []))
+            for callback in callbacks:
+                callback(stat)
+
+
+class FileSearch(object):
+    """Search files recursively, directories are scanned by a pool of threads
+
+    Matches of each directory are sent to the main loop as soon as it is scanned.
+    Each search has its own threads and LoopCaller, released when it ends or is cancelled.
+    Without main loop, the search is done synchronously.
+    """
+    max_workers = 4
+
+    class _Run(object):
+        """State of one search"""
+
+        def __init__(self, search_id, match, show_hidden, max_depth, max_results):
+            self.search_id = search_id
+            self.match = match
+            self.show_hidden = show_hidden
+            self.max_depth = max_depth
+            self.max_results = max_results
+            self.found = 0
+            self.pending = 1 # number of directories not scanned yet
+            self.truncated = False
+            self.queue = collections.deque() # directories to scan in synchronous mode
+            self.caller = None
+            self.executor = None
+
+        def release(self):
+            """Stop the threads and the LoopCaller of this search"""
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.caller.close()
+                self.executor = self.caller = None
+
+    def __init__(self, loop, on_matches, on_end):
+        """
+        @param loop: urwid main loop, or None to search synchronously
+        @param on_matches: method called with a list of FileEntry, their names are
+            paths relative to the search root
+        @param on_end: method called when the search is finished, with a boolean which
+            is True if the search was stopped because max_results was reached
+        """
+        self.loop = loop
+        self._on_matches = on_matches
+        self._on_end = on_end
+        self._search_id = 0
+        self._run = None # current search
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def compilePattern(pattern):
+        """Return a method telling if a name match pattern (case insensitive)
+
+        @param pattern: glob pattern if it contains wildcards, else substring to search
+        """
+        if any(char in pattern for char in '*?['):
+            return re.compile(fnmatch.translate(pattern), re.IGNORECASE).match
+        pattern = pattern.lower()
+        return lambda name: pattern in name.lower()
+
+    def search(self, root, pattern, show_hidden=True, max_depth=None, max_results=1000):
+        """Start a search and cancel the current one if any
+
+        @param root: directory where the search starts
+        @param pattern: see compilePattern
+        @param show_hidden: False to ignore hidden files and directories
+        @param max_depth: maximum depth of directories scanned below root, None for no limit
+        @param max_results: the search stops when this number of matches is reached
+        """
+        self.cancel()
+        run = self._Run(self._search_id, self.compilePattern(pattern), show_hidden, max_depth, max_results)
+        if self.loop is not None:
+            run.caller = LoopCaller(self.loop)
+            run.executor = concurrent.futures.ThreadPoolExecutor(self.max_workers)
+        self._run = run
+        self._submit(run, root, '', 0)
+        if self.loop is None:
+            while run.queue:
+                self._scanDirectory(run, *run.queue.popleft())
+
+    def cancel(self):
+        """Cancel current search and stop its threads, nothing more will be reported from it"""
+        self._search_id += 1
+        run, self._run = self._run, None
+        if run is not None:
+            run.release()
+
+    def close(self):
+        """Cancel current search"""
+        self.cancel()
+
+    def _submit(self, run, path, rel_path, depth):
+        if self.loop is None:
+            run.queue.append((path, rel_path, depth))
+            return
+        executor = run.executor
+        if executor is None:
+            # the search has been cancelled
+            return
+        try:
+            executor.submit(self._scanDirectory, run, path, rel_path, depth)
+        except RuntimeError:
+            # the executor has been shut down by cancel
+            pass
+
+    def _send(self, run, method, *args):
+        if self.loop is None:
+            method(*args)
+        else:
+            caller = run.caller
+            if caller is not None:
+                caller.call(self._deliver, run.search_id, method, args)
+
+    def _deliver(self, search_id, method, args):
+        if search_id == self._search_id:
+            method(*args)
+
+    def _end(self, truncated):
+        """Release the finished search, and call on_end"""
+        run, self._run = self._run, None
+        if run is not None:
+            run.release()
+        self._on_end(truncated)
+
+    def _scanDirectory(self, run, path, rel_path, depth):
+        """Scan one directory, called in a worker thread"""
+        matches = []
+        subdirs = []
+        if run.search_id == self._search_id and not run.truncated:
+            try:
+                with os.scandir(path) as it:
+                    for dir_entry in it:
+                        name = dir_entry.name
+                        if not run.show_hidden and name.startswith('.'):
+                            continue
+                        try:
+                            is_dir = dir_entry.is_dir()
+                            # we don't follow symlinks to avoid loops
+                            recurse = is_dir and not dir_entry.is_symlink()
+                        except OSError:
+                            is_dir = recurse = False
+                        entry_path = os.path.join(rel_path, name) if rel_path else name
+                        if run.match(name):
+                            matches.append(FileEntry(entry_path, is_dir, dir_entry.inode()))
+                        if recurse and (run.max_depth is None or depth < run.max_depth):
+                            subdirs.append((dir_entry.path, entry_path))
+            except OSError:
+                pass
+        with self._lock:
+            if matches:
+                matches = matches[:run.max_results - run.found]
+                run.found += len(matches)
+                if run.found >= run.max_results:
+                    run.truncated = True
+            if run.truncated:
+                subdirs = []
+            run.pending += len(subdirs) - 1
+            finished = run.pending == 0
+        if matches:
+            self._send(run, self._on_matches, matches)
+        for subdir_path, subdir_rel_path in subdirs:
+            self._submit(run, subdir_path, subdir_rel_path, depth+1)
+        if finished:
+            self._send(run, self._end, run.truncated)
+
+
+class DirectoryWatcher(object):
+    """Watch a directory and call a method when its content changes
+
+    inotify is used if available, else the modification time of the directory is polled.
+    Bursts of changes are coalesced, and reported only once.
+    """
+    coalesce_delay = 0.1
+    poll_delay = 1.0
+    # IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_CLOSE_WRITE | IN_ATTRIB | IN_ONLYDIR
+    _inotify_mask = 0x100 | 0x200 | 0x40 | 0x80 | 0x08 | 0x04 | 0x01000000
+    _inotify_overflow = 0x4000 # IN_Q_OVERFLOW
+
+    def __init__(self, loop, on_change):
+        """
+        @param loop: urwid main loop
+        @param on_change: method called when the directory changed, with the set of
+            changed names, or None if they are not known (polling, inotify overflow)
+        """
+        self.loop = loop
+        self.path = None
+        self._on_change = on_change
+        self._changed_names = set() # None if unknown
+        self._wd = None
+        self._stat_key = None
+        self._change_alarm = None
+        self._poll_alarm = None
+        self._libc = None
+        self._inotify_fd = None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            inotify_fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            log.info("inotify is not available, directories will be polled")
+        else:
+            if inotify_fd >= 0:
+                self._libc = libc
+                self._inotify_fd = inotify_fd
+                self._watch_handle = loop.watch_file(inotify_fd, self._onInotify)
+
+    def watch(self, path):
+        """Watch path instead of the directory currently watched"""
+        self.stop()
+        self.path = path
+        if self._inotify_fd is not None:
+            wd = self._libc.inotify_add_watch(self._inotify_fd, os.fsencode(path), self._inotify_mask)
+            if wd >= 0:
+                self._wd = wd
+                return
+            # no more inotify watch available, we fall back to polling
+        try:
+            self._stat_key = DirectoryCache.statKey(path)
+        except OSError:
+            self._stat_key = None
+        self._poll_alarm = self.loop.set_alarm_in(self.poll_delay, self._poll)
+
+    def stop(self):
+        """Stop watching current directory"""
+        self.path = None
+        if self._wd is not None:
+            self._libc.inotify_rm_watch(self._inotify_fd, self._wd)
+            self._wd = None
+        for alarm in (self._poll_alarm, self._change_alarm):
+            if alarm is not None:
+                self.loop.remove_alarm(alarm)
+        self._poll_alarm = self._change_alarm = None
+        self._changed_names = set()
+
+    def close(self):
+        """Stop watching and free inotify resources"""
+        self.stop()
+        if self._inotify_fd is not None:
+            self.loop.remove_watch_file(self._watch_handle)
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+    def _changed(self, name=None):
+        """Register a change
+
+        @param name: name of the changed entry, or None if unknown
+        """
+        if name is None:
+            self._changed_names = None
+        elif self._changed_names is not None:
+            self._changed_names.add(name)
+        if self._change_alarm is None:
+            self._change_alarm = self.loop.set_alarm_in(self.coalesce_delay, self._notify)
+
+    def _notify(self, loop, user_data):
+        self._change_alarm = None
+        changed_names = self._changed_names
+        self._changed_names = set()
+        self._on_change(changed_names)
+
+    def _onInotify(self):
+        while True:
+            try:
+                data = os.read(self._inotify_fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, name_len = struct.unpack_from('iIII', data, offset)
+                name = data[offset+16:offset+16+name_len].rstrip(b'\0')
+                offset += 16 + name_len
+                if mask & self._inotify_overflow:
+                    # events have been lost (wd is -1)
+                    if self._wd is not None:
+                        self._changed()
+                elif self._wd is not None and wd == self._wd and name:
+                    # events of previous watches (e.g. IN_IGNORED sent by inotify_rm_watch)
+                    # and events about the directory itself are ignored
+                    self._changed(os.fsdecode(name))
+
+    def _poll(self, loop, user_data):
+        try:
+            stat_key = DirectoryCache.statKey(self.path)
+        except OSError:
+            stat_key = None
+        if stat_key != self._stat_key:
+            self._stat_key = stat_key
+            self._changed()
+        self._poll_alarm = self.loop.set_alarm_in(self.poll_delay, self._poll)
+
+
+def statPath(path):
+    """Return os.stat of path, or its os.lstat for broken symlinks
+
+    @return (os.stat_result, None): stat, or None if the file can't be accessed
+    """
+    try:
+        return os.stat(path)
+    except OSError:
+        try:
+            return os.lstat(path)
+        except OSError:
+            return None
+
+
+def naturalKey(name):
+    """Sort key where numbers are compared by value (e.g. "file2" < "file10")"""
+    parts = re.split(r'(\d+)', name.lower())
+    return [int(part) if idx % 2 else part for idx, part in enumerate(parts)]
+
+
+def formatSize(size):
+    """Return a short human readable size"""
+    if size < 1024:
+        return str(size)
+    for unit in 'KMGTP':
+        size /= 1024.0
+        if size < 1024:
+            break
+    return '{:.1f}{}'.format(size, unit)
+
+
+class FileDetailsRow(sat_widgets.HighlightColumns):
+    """Row with a file name followed by its size, modification time and permissions
+
+    the stat is only requested when the row is rendered for the first time
+    """
+
+    def __init__(self, name_widget, path, inode, stat_fetcher):
+        """
+        @param name_widget: widget showing the file name
+        @param path: full path of the file
+        @param inode: inode of the file, or None if unknown
+        @param stat_fetcher: StatFetcher to use
+        """
+        super(FileDetailsRow, self).__init__((1, 2, 3), 'default_focus', [], dividechars=1)
+        self.name_widget = name_widget
+        self._path = path
+        self._inode = inode
+        self._stat_fetcher = stat_fetcher
+        self._stat_requested = False
+        self._size = urwid.Text('', 'right', 'clip')
+        self._mtime = urwid.Text('', wrap='clip')
+        self._mode = urwid.Text('', wrap='clip')
+        self.addWidget(name_widget, self.options())
+        self.addWidget(self._size, self.options('given', 7))
+        self.addWidget(self._mtime, self.options('given', 16))
+        self.addWidget(self._mode, self.options('given', 10))
+
+    def get_text(self):
+        return self.name_widget.get_text()
+
+    def _onStat(self, stat):
+        if stat is None:
+            self._size.set_text('?')
+            return
+        self._size.set_text(formatSize(stat.st_size))
+        self._mtime.set_text(strftime('%Y-%m-%d %H:%M', localtime(stat.st_mtime)))
+        self._mode.set_text(filemode(stat.st_mode))
+
+    def render(self, size, focus=False):
+        if not self._stat_requested:
+            self._stat_requested = True
+            self._stat_fetcher.request(self._path, self._inode, self._onStat)
+        return super(FileDetailsRow, self).render(size, focus)
+
+
+def fuzzyScore(query, name):
+    """Score a fuzzy match of query in name, in the way of fzf
+
+    characters of query must appear in name in the same order, the score
+    is better for consecutive characters and for matches at words starts
+    @param query: lowercase query
+    @param name: lowercase name
+    @return (int, None): score (higher is better), or None if name doesn't match
+    """
+    score = 0
+    prev_pos = -1
+    for char in query:
+        pos = name.find(char, prev_pos + 1)
+        if pos == -1:
+            return None
+        score += 16
+        if pos == 0 or name[pos-1] in '._- ':
+            score += 8
+        if prev_pos >= 0:
+            gap = pos - prev_pos - 1
+            score += 8 if not gap else -min(gap, 8)
+        prev_pos = pos
+    return score
+
+
+class TypeAheadIndex(object):
+    """Lowercase names of rows, used to find the row matching typed keys
+
+    When the query grows, only the rows which matched the previous query are checked again.
+    """
+    modes = ('prefix', 'substring', 'fuzzy')
+
+    def __init__(self, rows):
+        """
+        @param rows: rows shown in FilesViewer
+        """
+        self._names = [(idx, row.name.lower()) for idx, row in enumerate(rows) if isinstance(row, FileEntry)]
+        self._query = None
+        self._mode = None
+        self._candidates = self._names
+
+    def search(self, query, mode='prefix'):
+        """Find the best row for query
+
+        @param query: text typed by the user
+        @param mode: one of:
+            - 'prefix': first name starting with query
+            - 'substring': first name containing query
+            - 'fuzzy': name with the best fuzzyScore
+        @return (int, None): index of the row, or None if nothing match
+        """
+        query = query.lower()
+        if mode == self._mode and query.startswith(self._query):
+            # matches of the new query are a subset of the previous ones
+            candidates = self._candidates
+        else:
+            candidates = self._names
+        if mode == 'prefix':
+            candidates = [candidate for candidate in candidates if candidate[1].startswith(query)]
+        elif mode == 'substring':
+            candidates = [candidate for candidate in candidates if query in candidate[1]]
+        elif mode == 'fuzzy':
+            regex = re.compile('.*?'.join(re.escape(char) for char in query))
+            candidates = [candidate for candidate in candidates if regex.search(candidate[1])]
+        else:
+            raise ValueError("Unknown type-ahead mode: {}".format(mode))
+        self._query = query
+        self._mode = mode
+        self._candidates = candidates
+        if not candidates:
+            return None
+        if mode == 'fuzzy':
+            # on equal scores, the first row wins
+            return max(candidates, key=lambda candidate: (fuzzyScore(query, candidate[1]), -candidate[0]))[0]
+        return candidates[0][0]
+
+
+class FilesWalker(urwid.ListWalker):
+    """ListWalker which only keep light rows and build widgets when they are needed
+
+    rows are FileEntry instances, SEPARATOR, or already built widgets
+    """
+    cache_size = 256
+
+    def __init__(self, build_cb):
+        """
+        @param build_cb: method called with a row and returning the widget to display
+        """
+        self._build_cb = build_cb
+        self._rows = []
+        self._widgets = collections.OrderedDict() # row => widget, for rows built recently
+        self.focus = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, position):
+        if position < 0:
+            raise IndexError(position)
+        row = self._rows[position]
+        try:
+            widget = self._widgets[row]
+        except KeyError:
+            widget = self._widgets[row] = self._build_cb(row)
+            if len(self._widgets) > self.cache_size:
+                self._widgets.popitem(last=False)
+        else:
+            self._widgets.move_to_end(row)
+        return widget
+
+    def setRows(self, rows):
+        """Replace all rows
+
+        widgets of rows which were already there are reused if they are still in cache
+        """
+        self._rows = rows
+        self.focus = 0
+        self._modified()
+
+    def clearCache(self):
+        """Forget built widgets, must be called when rows of an other directory are set"""
+        self._widgets.clear()
+
+    def forget(self, row):
+        """Forget the widget of a row, it will be built again when needed"""
+        if self._widgets.pop(row, None) is not None:
+            self._modified()
+
+    def get_focus(self):
+        if not self._rows:
+            return None, None
+        return self[self.focus], self.focus
+
+    def set_focus(self, position):
+        if not 0 <= position < len(self._rows):
+            raise IndexError(position)
+        self.focus = position
+        self._modified()
+
+    def next_position(self, position):
+        if position >= len(self._rows) - 1:
+            raise IndexError(position)
+        return position + 1
+
+    def prev_position(self, position):
+        if position <= 0:
+            raise IndexError(position)
+        return position - 1
+
+    def positions(self, reverse=False):
+        if reverse:
+            return range(len(self._rows) - 1, -1, -1)
+        return range(len(self._rows))
+
+
 class FilesViewer(urwid.WidgetWrap):
     """List specialised for files"""
+    sort_modes = ('name', 'natural', 'size', 'mtime', 'extension')
 
-    def __init__(self, onPreviousDir, onDirClick, onFileClick = None):
+    def __init__(self, onPreviousDir, onDirClick, onFileClick = None, virtual=False, details=False, loop=None, watch=False):
+        """
+        @param virtual: if True, widgets are only built for the rows which are displayed,
+            useful for huge directories
+        @param details: if True, size, modification time and permissions are shown in columns
+        @param loop: urwid main loop, used to get details in background
+        @param watch: if True, the directory shown is refreshed when its content changes
+            (loop is needed)
+        """
         self.path=''
         self.key_cache = ''
         self.key_time = time()
         self.onPreviousDir = onPreviousDir
         self.onDirClick = onDirClick
         self.onFileClick = onFileClick
-        self.files_list = urwid.SimpleListWalker([])
+        self.virtual = virtual
+        self.details = details
+        self.loop = loop
+        self.stat_fetcher = StatFetcher(loop) if details else None # created when needed for sorting
+        self.watcher = DirectoryWatcher(loop, self.refreshDirectory) if watch else None
+        self._scanning = False # True while entries are added with addEntries
+        self._searching = False # True when search results are shown instead of the directory
+        self._refresh_needed = False
+        self._refresh_names = set() # names changed while scanning, None if unknown
+        self._refresh_scanner = None # DirectoryScanner listing the directory again, created when needed
+        self._refresh_entries = None # entries got by _refresh_scanner, None if it is not running
+        self._rows = []
+        self._directories = []
+        self._files = []
+        self._error = False
+        self._widgets = {} # row => widget, used when not in virtual mode
+        self.sort_mode = 'name' # one of sort_modes
+        self.sort_reverse = False
+        self._sort_keys = {} # sort mode => {FileEntry: sort key}, for current listing
+        self._entries_stats = {} # FileEntry => os.stat_result (or None) received from stat_fetcher
+        self._sort_alarm = None
+        self._sorting = False
+        if virtual:
+            self.files_list = FilesWalker(self._buildWidget)
+        else:
+            self.files_list = urwid.SimpleListWalker([])
         self.show_hidden = True
+        self.typeahead_mode = 'prefix' # one of TypeAheadIndex.modes
+        self._typeahead = None # TypeAheadIndex of current rows, built when needed
         listbox = urwid.ListBox(self.files_list)
         urwid.WidgetWrap.__init__(self, listbox)
 
     def keypress(self, size, key):
-        if key==a_key['FILES_HIDDEN_HIDE']:
+        action = a_key.get_action(key, 'files_management')
+        if action == 'FILES_HIDDEN_HIDE':
             #(un)hide hidden files
             self.show_hidden = not self.show_hidden
-            self.showDirectory(self.path)
-        elif key==a_key['FILES_JUMP_DIRECTORIES']:
+            self._updateRows()
+        elif action == 'FILES_SORT':
+            idx = self.sort_modes.index(self.sort_mode) + 1
+            self.setSortMode(self.sort_modes[idx % len(self.sort_modes)], self.sort_reverse)
+        elif action == 'FILES_SORT_REVERSE':
+            self.setSortMode(self.sort_mode, not self.sort_reverse)
+        elif action == 'FILES_JUMP_DIRECTORIES':
             #jump to directories
             if self.files_list:
                 self._w.set_focus(0)
-        elif key==a_key['FILES_JUMP_FILES']:
-            for idx in range(len(self.files_list)):
-                if isinstance(self.files_list[idx].base_widget,urwid.Divider):
-                    if idx<len(self.files_list)-1:
-                        self._w.set_focus(idx+1)
-                    break
+        elif action == 'FILES_JUMP_FILES':
+            try:
+                idx = self._rows.index(SEPARATOR)
+            except ValueError:
+                pass
+            else:
+                if idx<len(self._rows)-1:
+                    self._w.set_focus(idx+1)
         elif len(key) == 1:
             if time() - self.key_time > 2:
                 self.key_cache=key
             else:
                 self.key_cache+=key
             self.key_time = time()
-            for idx in range(len(self.files_list)):
-                if isinstance(self.files_list[idx],sat_widgets.ClickableText) and self.files_list[idx].get_text().lower().startswith(self.key_cache.lower()):
-                    self._w.set_focus(idx)
-                    break
+            if self._typeahead is None:
+                self._typeahead = TypeAheadIndex(self._rows)
+            idx = self._typeahead.search(self.key_cache, self.typeahead_mode)
+            if idx is not None:
+                self._w.set_focus(idx)
         else:
             return self._w.keypress(size, key)
 
-    def showDirectory(self, path):
+    def _buildWidget(self, row):
+        """Build the widget to display for a row"""
+        if row is SEPARATOR:
+            return urwid.AttrMap(urwid.Divider('-'),'separator')
+        if not isinstance(row, FileEntry):
+            return row
+        if row.is_dir:
+            widget = sat_widgets.ClickableText(('directory',row.name))
+            urwid.connect_signal(widget,'click',self.onPreviousDir if row.name == '..' else self.onDirClick)
+        else:
+            widget = sat_widgets.ClickableText(row.name)
+            if self.onFileClick:
+                urwid.connect_signal(widget,'click',self.onFileClick)
+        if self.details and row.name != '..':
+            widget = FileDetailsRow(widget, os.path.join(self.path, row.name), row.inode, self.stat_fetcher)
+        return widget
+
+    def _setRows(self, rows, keep_focus=False):
+        """Show the given rows, building widgets now if we are not in virtual mode
+
+        @param keep_focus: if True, focus stays on the same position if possible
+        """
+        focus = self.files_list.focus if keep_focus else 0
+        self._rows = rows
+        self._typeahead = None
+        if self.virtual:
+            self.files_list.setRows(rows)
+        else:
+            widgets = self._widgets
+            for row in rows:
+                if row not in widgets:
+                    widgets[row] = self._buildWidget(row)
+            self.files_list[:] = [widgets[row] for row in rows]
+            if len(widgets) > 2 * len(rows):
+                # widgets of hidden files are kept, but not the ones of deleted files
+                self._widgets = {row: widgets[row] for row in rows}
+        if rows:
+            self.files_list.set_focus(min(focus, len(rows)-1))
+
+    def _applyRows(self, rows):
+        """Show the given rows by replacing only the rows which changed or moved
+
+        widgets of other rows are kept, and the focus stays on the same row
+        """
+        old_rows = self._rows
+        focused = old_rows[self.files_list.focus] if old_rows else None
+        new_set = set(rows)
+        self._rows = rows
+        self._typeahead = None
+        if self.virtual:
+            self.files_list.setRows(rows)
+        else:
+            widgets = self._widgets
+            for row in old_rows:
+                if row not in new_set:
+                    widgets.pop(row, None)
+            for row in rows:
+                if row not in widgets:
+                    widgets[row] = self._buildWidget(row)
+            # as in GenericList._applyWidgets, the longest run of kept rows in the
+            # same order stay in place, and the gaps between them are replaced
+            old_positions = {row: position for position, row in enumerate(old_rows)}
+            kept = [(position, old_positions[row]) for position, row in enumerate(rows) if row in old_positions]
+            anchors = sat_widgets.longestIncreasing(kept)
+            anchors.append((len(old_rows), len(rows)))
+            gaps = []
+            old_start = new_start = 0
+            for old_position, new_position in anchors:
+                if old_start != old_position or new_start != new_position:
+                    gaps.append((old_start, old_position, new_start, new_position))
+                old_start, new_start = old_position + 1, new_position + 1
+            for old_start, old_end, new_start, new_end in reversed(gaps):
+                self.files_list[old_start:old_end] = [widgets[row] for row in rows[new_start:new_end]]
+        if focused in new_set:
+            self.files_list.set_focus(rows.index(focused))
+        elif rows:
+            self.files_list.set_focus(min(self.files_list.focus, len(rows)-1))
+
+    def _buildRows(self):
+        """Build the rows from current directories and files"""
+        rows = []
+        if self._error:
+            rows.append(urwid.Text(("warning",_("Impossible to list directory")),'center'))
+        if os.path.abspath(self.path)!='/' and os.path.abspath(self.path) != '//':
+            rows.append(FileEntry('..', True, None))
+        for entry in self._directories:
+            if entry.name.startswith('.') and not self.show_hidden:
+                continue
+            rows.append(entry)
+        rows.append(SEPARATOR)
+        for entry in self._files:
+            if entry.name.startswith('.') and not self.show_hidden:
+                continue
+            rows.append(entry)
+        return rows
+
+    def _updateRows(self, keep_focus=False):
+        self._setRows(self._buildRows(), keep_focus)
+
+    def _forgetChanged(self, names):
+        """Forget stats, sort keys and details widgets of changed entries
+
+        @param names: names of the changed entries, or None if unknown
+        @return (bool): True if all widgets must be built again
+        """
+        if names is None:
+            if self.stat_fetcher is not None:
+                self.stat_fetcher.clear()
+            self._entries_stats = {}
+            for mode in ('size', 'mtime'):
+                self._sort_keys.pop(mode, None)
+            if self.details:
+                self._widgets = {}
+                if self.virtual:
+                    self.files_list.clearCache()
+            return self.details
+        changed = [entry for entry in self._directories + self._files if entry.name in names]
+        for entry in changed:
+            self._entries_stats.pop(entry, None)
+            for mode in ('size', 'mtime'):
+                self._sort_keys.get(mode, {}).pop(entry, None)
+            if self.stat_fetcher is not None:
+                self.stat_fetcher.forget(os.path.join(self.path, entry.name), entry.inode)
+            if self.details:
+                # the widget will be built again, with the new stat
+                self._widgets.pop(entry, None)
+                if self.virtual:
+                    self.files_list.forget(entry)
+                elif entry in self._rows:
+                    idx = self._rows.index(entry)
+                    self.files_list[idx] = self._widgets[entry] = self._buildWidget(entry)
+        return False
+
+    def refreshDirectory(self, changed_names=None):
+        """Update the listing, and only apply the differences to the rows shown
+
+        when changed names are known, only these entries are checked, else the
+        directory is listed again (in background if there is a main loop)
+        @param changed_names: names of changed entries, or None if unknown
+        """
+        if self._searching:
+            return
+        if self._scanning or self._refresh_entries is not None:
+            self._refresh_needed = True
+            if changed_names is None or self._refresh_names is None:
+                self._refresh_names = None
+            else:
+                self._refresh_names.update(changed_names)
+            return
+        # the cached listing may not be valid anymore, even if the directory stat
+        # didn't change (e.g. changes done in the same tick)
+        directory_cache.invalidate(self.path)
+        if changed_names is None:
+            if self.loop is not None:
+                if os.path.isdir(self.path):
+                    # DirectoryScanner doesn't report anything for missing directories
+                    self._startRefreshScan()
+                return
+            try:
+                directories, files = listDirectory(self.path)
+            except OSError:
+                return
+            self._applyListing(directories, files)
+        else:
+            self._applyChanges(changed_names)
+
+    def _applyChanges(self, changed_names):
+        """Check changed entries again, and update the rows
+
+        @param changed_names: names of the changed entries
+        """
+        self._forgetChanged(changed_names)
+        new_entries = []
+        for name in changed_names:
+            entry = getEntry(self.path, name)
+            if entry is not None:
+                new_entries.append(entry)
+        # entries are still sorted after removing the changed ones, and their
+        # sort keys are kept
+        directories = [entry for entry in self._directories if entry.name not in changed_names]
+        files = [entry for entry in self._files if entry.name not in changed_names]
+        self._directories, self._files = self._mergeEntries(directories, files, new_entries)
+        self._showChanges()
+
+    def _applyListing(self, directories, files):
+        """Use a new listing of the current directory, where changed entries are unknown
+
+        @param directories: list of directories FileEntry, sorted by name
+        @param files: list of files FileEntry, sorted by name
+        """
+        rebuild = self._forgetChanged(None)
+        self._directories, self._files = directories, files
+        if self.sort_mode != 'name' or self.sort_reverse:
+            self._sortEntries()
+        self._showChanges(rebuild)
+
+    def _showChanges(self, rebuild=False):
+        """Update the rows after a change of the listing
+
+        @param rebuild: True if all widgets must be built again
+        """
+        if self._error or rebuild:
+            self._error = False
+            self._updateRows(keep_focus=True)
+        else:
+            self._applyRows(self._buildRows())
+
+    def _startRefreshScan(self):
+        """List the current directory again in background"""
+        if self._refresh_scanner is None:
+            # the cache is not used, as the change may not be visible in the directory stat
+            self._refresh_scanner = DirectoryScanner(self.loop, lambda path: None, self._onRefreshEntries,
+                                                     self._onRefreshEnd, cache=None)
+        self._refresh_needed = False
+        self._refresh_names = set()
+        self._refresh_entries = []
+        self._refresh_scanner.scan(self.path)
+
+    def _onRefreshEntries(self, entries):
+        self._refresh_entries.extend(entries)
+
+    def _onRefreshEnd(self, error):
+        entries = self._refresh_entries
+        self._refresh_entries = None
+        if not error:
+            directories = sorted(entry for entry in entries if entry.is_dir)
+            files = sorted(entry for entry in entries if not entry.is_dir)
+            self._applyListing(directories, files)
+        if self._refresh_needed:
+            self._refresh_needed = False
+            self.refreshDirectory(self._refresh_names)
+
+    def _resetListing(self, path):
+        """Forget everything linked to the listing currently shown"""
         self.path = path
-        del self.files_list[:]
-        directories = []
-        files = []
+        self._error = False
+        self._scanning = False
+        self._searching = False
+        self._sort_keys = {}
+        self._entries_stats = {}
+        if self._sort_alarm is not None:
+            self.loop.remove_alarm(self._sort_alarm)
+            self._sort_alarm = None
+        self._widgets = {}
+        if self.virtual:
+            self.files_list.clearCache()
+        if self.stat_fetcher is not None:
+            self.stat_fetcher.clear()
+        if self._refresh_scanner is not None:
+            self._refresh_scanner.cancel()
+        self._refresh_entries = None
+        if self.watcher is not None:
+            self.watcher.watch(path)
+
+    def _entryStat(self, entry):
+        """Return the stat of an entry, requesting it to stat_fetcher if needed
+
+        when the stat arrives later, entries are sorted again
+        @return (os.stat_result, None, False): stat, None if the file can't be accessed,
+            or False if the stat is not known yet
+        """
+        try:
+            return self._entries_stats[entry]
+        except KeyError:
+            pass
+        self._entries_stats[entry] = False
+        if self.stat_fetcher is None:
+            self.stat_fetcher = StatFetcher(self.loop)
+        self.stat_fetcher.request(os.path.join(self.path, entry.name), entry.inode,
+                                  lambda stat: self._onEntryStat(entry, stat))
+        return self._entries_stats[entry]
+
+    def _onEntryStat(self, entry, stat):
+        if entry not in self._entries_stats:
+            # the listing has changed
+            return
+        self._entries_stats[entry] = stat
+        for mode in ('size', 'mtime'):
+            self._sort_keys.get(mode, {}).pop(entry, None)
+        if (self.sort_mode in ('size', 'mtime') and not self._sorting
+            and self.loop is not None and self._sort_alarm is None):
+            # stats arrive by batches, we sort once per batch
+            self._sort_alarm = self.loop.set_alarm_in(0, self._onSortAlarm)
+
+    def _onSortAlarm(self, loop, user_data):
+        self._sort_alarm = None
+        self._resort()
+
+    def _sortKey(self, entry):
+        """Compute sort key of an entry for the current sort mode"""
+        mode = self.sort_mode
+        if mode == 'natural':
+            return (naturalKey(entry.name), entry.name)
+        if mode == 'extension':
+            return (os.path.splitext(entry.name)[1].lower(), entry.name)
+        if mode in ('size', 'mtime'):
+            stat = self._entryStat(entry)
+            if not stat:
+                # unknown yet or not accessible
+                return (-1, entry.name)
+            return (stat.st_size if mode == 'size' else stat.st_mtime, entry.name)
+        raise ValueError("Unknown sort mode: {}".format(mode))
+
+    def _getSortKey(self):
+        """Return the key method to use with sorted, or None to sort by name
+
+        sort keys are computed only once per listing and entry
+        """
+        if self.sort_mode == 'name':
+            return None
+        keys = self._sort_keys.setdefault(self.sort_mode, {})
+        def key(entry):
+            try:
+                return keys[entry]
+            except KeyError:
+                entry_key = keys[entry] = self._sortKey(entry)
+                return entry_key
+        return key
+
+    def _sortEntries(self):
+        """Sort directories and files according to sort mode"""
+        key = self._getSortKey()
+        self._sorting = True
         try:
-            for filename in os.listdir(path):
-                if not isinstance(filename, str):
-                    log.warning("file [{}] has a badly encode filename, ignoring it".format(filename.decode('utf-8', 'replace')))
-                    continue
-                fullpath = os.path.join(path,filename)
-                if os.path.isdir(fullpath):
-                    directories.append(filename)
-                else:
-                    files.append(filename)
+            # lists may come from directory_cache, so they are not sorted in place
+            self._directories = sorted(self._directories, key=key, reverse=self.sort_reverse)
+            self._files = sorted(self._files, key=key, reverse=self.sort_reverse)
+        finally:
+            self._sorting = False
+
+    def _resort(self):
+        """Sort entries again and update rows, the focus stays on the same row"""
+        focused = self._rows[self.files_list.focus] if self._rows else None
+        self._sortEntries()
+        self._updateRows()
+        if isinstance(focused, FileEntry) and focused in self._rows:
+            self.files_list.set_focus(self._rows.index(focused))
+
+    def setSortMode(self, mode, reverse=False):
+        """Change the order of entries, without listing the directory again
+
+        with 'size' and 'mtime' modes, stats are got in background if there is
+        a main loop, and entries are sorted again when they arrive
+        @param mode: one of sort_modes
+        @param reverse: True to sort in descending order
+        """
+        if mode not in self.sort_modes:
+            raise ValueError("Unknown sort mode: {}".format(mode))
+        self.sort_mode = mode
+        self.sort_reverse = reverse
+        self._resort()
+
+    def showDirectory(self, path):
+        self._resetListing(path)
+        try:
+            self._directories, self._files = directory_cache.get(path)
         except OSError:
-           self.files_list.append(urwid.Text(("warning",_("Impossible to list directory")),'center'))
-        directories.sort()
-        files.sort()
-        if os.path.abspath(path)!='/' and os.path.abspath(path) != '//':
-            previous_wid = sat_widgets.ClickableText(('directory','..'))
-            urwid.connect_signal(previous_wid,'click',self.onPreviousDir)
-            self.files_list.append(previous_wid)
-        for directory in directories:
-            if directory.startswith('.') and not self.show_hidden:
-                continue
-            dir_wid = sat_widgets.ClickableText(('directory',directory))
-            urwid.connect_signal(dir_wid,'click',self.onDirClick)
-            self.files_list.append(dir_wid)
-        self.files_list.append(urwid.AttrMap(urwid.Divider('-'),'separator'))
-        for filename in files:
-            if filename.startswith('.') and not self.show_hidden:
-                continue
-            file_wid = sat_widgets.ClickableText(filename)
-            if self.onFileClick:
-                urwid.connect_signal(file_wid,'click',self.onFileClick)
-            self.files_list.append(file_wid)
+            self._error = True
+            self._directories = []
+            self._files = []
+        if self.sort_mode != 'name' or self.sort_reverse:
+            # listing from directory_cache is already sorted by name
+            self._sortEntries()
+        self._updateRows()
+
+    def startDirectory(self, path):
+        """Show an empty directory, entries will be added with addEntries"""
+        self._resetListing(path)
+        self._directories = []
+        self._files = []
+        self._scanning = True
+        self._refresh_needed = False
+        self._refresh_names = set()
+        self._updateRows()
+
+    def startSearch(self, root):
+        """Show an empty list for a search in root, matches will be added with addEntries
+
+        names of entries are paths relative to root
+        """
+        self.startDirectory(root)
+        self._searching = True
+        if self.watcher is not None:
+            self.watcher.stop()
+
+    def addEntries(self, entries):
+        """Add entries to the directory currently shown
+
+        @param entries: list of FileEntry
+        """
+        self._directories, self._files = self._mergeEntries(self._directories, self._files, entries)
+        self._updateRows(keep_focus=True)
+
+    def _mergeEntries(self, directories, files, entries):
+        """Add entries to sorted directories and files
+
+        only the new entries are sorted, then merged with the sorted ones
+        @param directories: directories FileEntry, sorted according to sort mode
+        @param files: files FileEntry, sorted according to sort mode
+        @param entries: FileEntry to add
+        @return (tuple): new (directories, files) lists
+        """
+        key = self._getSortKey()
+        self._sorting = True
+        try:
+            new_directories = sorted((entry for entry in entries if entry.is_dir), key=key, reverse=self.sort_reverse)
+            new_files = sorted((entry for entry in entries if not entry.is_dir), key=key, reverse=self.sort_reverse)
+            directories = list(heapq.merge(directories, new_directories, key=key, reverse=self.sort_reverse))
+            files = list(heapq.merge(files, new_files, key=key, reverse=self.sort_reverse))
+        finally:
+            self._sorting = False
+        return directories, files
+
+    def endDirectory(self, error=False):
+        """Called when all the entries have been added
+
+        @param error: True if the directory could not be fully listed
+        """
+        self._scanning = False
+        if error:
+            self._error = True
+            self._updateRows(keep_focus=True)
+        elif self._refresh_needed:
+            self._refresh_needed = False
+            self.refreshDirectory(self._refresh_names)
+
+    def close(self):
+        """Stop background tasks"""
+        if self.watcher is not None:
+            self.watcher.close()
+        if self._refresh_scanner is not None:
+            self._refresh_scanner.close()
+            self._refresh_entries = None
+        if self._sort_alarm is not None:
+            self.loop.remove_alarm(self._sort_alarm)
+            self._sort_alarm = None
+        if self.stat_fetcher is not None:
+            self.stat_fetcher.close()
+
+
+class CompletionIndex(object):
+    """Sorted index of the directories names where completion is done"""
+
+    def __init__(self, completed_path, head, dir_start, names):
+        """
+        @param completed_path: path to complete
+        @param head: directory where the completion is done
+        @param dir_start: start of the name to complete (case insensitive)
+        @param names: names of the directories in head
+        """
+        self.completed_path = completed_path
+        self.head = head
+        self._entries = sorted((name.lower(), name) for name in names)
+        prefix = dir_start.lower()
+        self._start = bisect.bisect_left(self._entries, (prefix,))
+        self._end = bisect.bisect_left(self._entries, (prefix + '\U0010ffff',))
+
+    def next(self, last_name=None):
+        """Return the name to use for the next completion
+
+        @param last_name: name used for the last completion, or None for the first one
+        @return (unicode, None): name, or None if nothing match
+        """
+        if self._start == self._end:
+            return None
+        idx = self._start
+        if last_name is not None:
+            last_idx = bisect.bisect_left(self._entries, (last_name.lower(), last_name))
+            if self._start <= last_idx < self._end and self._entries[last_idx][1] == last_name:
+                idx = last_idx + 1
+                if idx == self._end:
+                    idx = self._start
+        return self._entries[idx][1]
+
+
+class BookmarksSource(object, metaclass=abc.ABCMeta):
+    """Bookmarks read from a file, subclasses must implement parse
+
+    Parsed bookmarks are cached for the whole process, and the file is only parsed
+    again if its modification time or size changed. Sources may be loaded from
+    other threads.
+    """
+    _cache = {} # path => (stat key, bookmarks)
+    _lock = threading.Lock()
+    name = 'bookmarks'
+
+    def __init__(self, path):
+        """
+        @param path: path of the bookmarks file, "~" is expanded
+        """
+        self.path = os.path.expanduser(path)
+
+    @abc.abstractmethod
+    def parse(self):
+        """Parse the file
+
+        @return (iterable): bookmarked paths
+        @raise EnvironmentError: the file can't be read
+        """
+
+    def load(self):
+        """Return bookmarks, from cache if the file didn't change
+
+        @return (frozenset): bookmarked paths
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            log.info(_('No {} file found').format(self.name))
+            return frozenset()
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._cache.get(self.path)
+        if cached is not None and cached[0] == stat_key:
+            return cached[1]
+        try:
+            bookmarks = frozenset(self.parse())
+        except (EnvironmentError, ParseError) as e:
+            log.warning("Can't read {} file [{}]: {}".format(self.name, self.path, e))
+            return frozenset()
+        with self._lock:
+            self._cache[self.path] = (stat_key, bookmarks)
+        return bookmarks
+
+
+class GtkBookmarks(BookmarksSource):
+    """GTK bookmarks: one URL per line, optionally followed by a label"""
+    name = 'GTK bookmarks'
+
+    def parse(self):
+        with open(self.path) as gtk_fd:
+            for line in gtk_fd:
+                url = line.split(' ', 1)[0].rstrip('\n')
+                if url.startswith("file:///"):
+                    yield unquote(url[7:])
+
+
+class KdeBookmarks(BookmarksSource):
+    """KDE places (XBEL file), parsed in streaming"""
+    name = 'KDE bookmarks'
+
+    def parse(self):
+        for event, elem in iterparse(self.path):
+            if elem.tag == 'bookmark':
+                url = elem.get('href', '')
+                if url.startswith("file:///"):
+                    yield unquote(url[7:])
+                elem.clear()
+
+
+class RecentDirectories(object):
+    """Directories recently used in file dialogs of this process"""
+    name = 'recent directories'
+
+    def __init__(self, max_size=10):
+        self.max_size = max_size
+        self._directories = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, path):
+        """Add a directory, the oldest one is forgotten if there are too many"""
+        with self._lock:
+            self._directories.pop(path, None)
+            self._directories[path] = None
+            while len(self._directories) > self.max_size:
+                self._directories.popitem(last=False)
+
+    def load(self):
+        with self._lock:
+            return frozenset(self._directories)
+
+
+recent_directories = RecentDirectories()
+
+# sources used by default by FileDialog, new sources only need a load method returning paths
+BOOKMARKS_SOURCES = [GtkBookmarks("~/.gtk-bookmarks"),
+                     GtkBookmarks("~/.config/gtk-3.0/bookmarks"),
+                     KdeBookmarks("~/.kde/share/apps/kfileplaces/bookmarks.xml"),
+                     KdeBookmarks("~/.local/share/user-places.xbel"),
+                     recent_directories,
+                     ]
 
 
 class FileDialog(urwid.WidgetWrap):
 
-    def __init__(self, ok_cb, cancel_cb, message=None, title=_("Please select a file"), style=[]):
+    scan_delay = 0.2 # time to wait after last path change before scanning
+    search_max_depth = None
+    search_max_results = 1000
+
+    def __init__(self, ok_cb, cancel_cb, message=None, title=_("Please select a file"), style=[], loop=None, bookmarks_sources=None):
         """Create file dialog
 
         @param title: title of the window/popup
@@ -139,8 +1670,18 @@ class FileDialog(urwid.WidgetWrap):
             message will be passed to a Text widget, so markup can be used
         @param style: list of string:
             - 'dir' if a dir path must be selected
+            - 'virtual' to only build widgets of displayed files (for huge directories)
+            - 'details' to show size, modification time and permissions of files
+            - 'watch' to refresh the directory when its content changes (loop is needed)
+        @param loop: urwid main loop, if given directories are scanned and bookmarks loaded in background
+        @param bookmarks_sources: list of objects with a load method returning bookmarked paths,
+            None to use BOOKMARKS_SOURCES
         """
         self.ok_cb = ok_cb
+        self.cancel_cb = cancel_cb
+        self.loop = loop
+        self._closed = False
+        self._scan_alarm = None
         self._type = 'dir' if 'dir' in style else 'normal'
         self.__home_path = os.path.expanduser('~')
         widgets = []
@@ -152,105 +1693,175 @@ class FileDialog(urwid.WidgetWrap):
         urwid.connect_signal(self.path_wid, 'change', self.onPathChange)
         widgets.append(self.path_wid)
         widgets.append(urwid.Divider('─'))
-        header = urwid.Pile(widgets)
-        bookm_list = urwid.SimpleListWalker([])
-        self.bookmarks = list(self.getBookmarks())
-        self.bookmarks.sort()
-        for bookmark in self.bookmarks:
-            if bookmark.startswith(self.__home_path):
-                bookmark="~"+bookmark[len(self.__home_path):]
-            book_wid = sat_widgets.ClickableText(bookmark)
-            urwid.connect_signal(book_wid, 'click', self.onBookmarkSelected)
-            bookm_list.append(book_wid)
-        bookm_wid = urwid.Frame(urwid.ListBox(bookm_list), urwid.AttrMap(urwid.Text(_('Bookmarks'),'center'),'title'))
-        self.files_wid = FilesViewer(self.onPreviousDir, self.onDirClick, self.onFileClick if self._type == 'normal' else None)
+        header = self._header = urwid.Pile(widgets)
+        self.search_wid = sat_widgets.AdvancedEdit(_('Find: '))
+        urwid.connect_signal(self.search_wid, 'click', self.onSearch)
+        self.bookm_list = urwid.SimpleListWalker([])
+        self.bookmarks = []
+        self._bookmarks_sources = BOOKMARKS_SOURCES if bookmarks_sources is None else bookmarks_sources
+        if loop is None:
+            self._setBookmarks(self.getBookmarks())
+        else:
+            caller = LoopCaller(loop)
+            thread = threading.Thread(target=self._loadBookmarks, args=(caller,))
+            thread.daemon = True
+            thread.start()
+        bookm_wid = urwid.Frame(urwid.ListBox(self.bookm_list), urwid.AttrMap(urwid.Text(_('Bookmarks'),'center'),'title'))
+        self.files_wid = FilesViewer(self.onPreviousDir, self.onDirClick, self.onFileClick if self._type == 'normal' else None, 'virtual' in style, 'details' in style, loop, 'watch' in style and loop is not None)
+        if loop is not None:
+            self.scanner = DirectoryScanner(loop, self.files_wid.startDirectory, self.files_wid.addEntries, self.files_wid.endDirectory)
+        else:
+            self.scanner = None
+        self.searcher = FileSearch(loop, self.files_wid.addEntries, self._onSearchEnd)
         center_row = urwid.Columns([('weight',2,bookm_wid),
                      ('weight',8,sat_widgets.VerticalSeparator(self.files_wid))])
 
         buttons = []
         if self._type == 'dir':
             buttons.append(sat_widgets.CustomButton(_('Ok'), self._validateDir))
-        buttons.append(sat_widgets.CustomButton(_('Cancel'),cancel_cb))
+        buttons.append(sat_widgets.CustomButton(_('Cancel'),self._onCancel))
         max_len = max([button.getSize() for button in buttons])
         buttons_wid = urwid.GridFlow(buttons,max_len,1,0,'center')
-        main_frame = sat_widgets.FocusFrame(center_row, header, buttons_wid)
+        main_frame = self._main_frame = sat_widgets.FocusFrame(center_row, header, buttons_wid)
         decorated = sat_widgets.LabelLine(main_frame, sat_widgets.SurroundedText(title))
         urwid.WidgetWrap.__init__(self, decorated)
         self.path_wid.set_edit_text(os.getcwd())
 
+    def close(self):
+        """Stop background tasks
+
+        called automatically when a path is selected or the dialog is cancelled,
+        it must be called if the dialog is dismissed in an other way
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._scan_alarm is not None:
+            self.loop.remove_alarm(self._scan_alarm)
+            self._scan_alarm = None
+        if self.scanner is not None:
+            self.scanner.close()
+        self.searcher.close()
+        self.files_wid.close()
+
+    def keypress(self, size, key):
+        # the focused widget (e.g. path or search edit) gets the key first
+        key = super(FileDialog, self).keypress(size, key)
+        if key is not None and a_key.get_action(key, 'files_management') == 'FILES_SEARCH':
+            if self.isSearchShown():
+                self._hideSearch()
+                self.onPathChange(self.path_wid, self.path_wid.get_edit_text())
+            else:
+                self._header.contents.append((self.search_wid, self._header.options()))
+                self._header.focus_position = len(self._header.contents) - 1
+                self._main_frame.focus_position = 'header'
+            return
+        return key
+
+    def isSearchShown(self):
+        return self.search_wid in self._header.widget_list
+
+    def _hideSearch(self):
+        self.searcher.cancel()
+        if self.isSearchShown():
+            del self._header.contents[self._header.widget_list.index(self.search_wid)]
+
+    def onSearch(self, edit):
+        """Search files matching search_wid text below current path"""
+        pattern = edit.get_edit_text()
+        if not pattern:
+            return
+        root = os.path.abspath(self.path_wid.get_edit_text())
+        if not os.path.isdir(root):
+            root = os.path.dirname(root)
+        if self.scanner is not None:
+            self.scanner.cancel()
+            if self._scan_alarm is not None:
+                self.loop.remove_alarm(self._scan_alarm)
+                self._scan_alarm = None
+        self.files_wid.startSearch(root)
+        self.searcher.search(root, pattern, self.files_wid.show_hidden, self.search_max_depth, self.search_max_results)
+
+    def _onSearchEnd(self, truncated):
+        if truncated:
+            log.info(_("Search stopped after {} results").format(self.search_max_results))
+        self.files_wid.endDirectory()
+
     def _validateDir(self, wid):
         """ call ok callback if current path is a dir """
         path = os.path.abspath(self.path_wid.get_edit_text())
         if os.path.isdir(path):
+            recent_directories.add(path)
+            self.close()
             self.ok_cb(path)
 
     def _directory_completion(self, path, completion_data):
         assert isinstance(path, str)
         path=os.path.abspath(path)
-        if not os.path.isdir(path):
-            head,dir_start = os.path.split(path)
-        else:
-            head=path
-            dir_start=''
         try:
-            filenames = os.listdir(head)
-            to_remove = []
-
-            # we remove badly encoded files
-            for filename in filenames:
-                if not isinstance(filename, str):
-                    log.warning("file [{}] has a badly encode filename, ignoring it".format(filename.decode('utf-8', 'replace')))
-                    to_remove.append(filename)
-            for filename in to_remove:
-                filenames.remove(filename)
-
-            filenames.sort()
+            index = completion_data['index']
+            if index.completed_path != path:
+                raise KeyError
+        except KeyError:
+            # first completion for this path, next ones will reuse the index
+            if not os.path.isdir(path):
+                head,dir_start = os.path.split(path)
+            else:
+                head=path
+                dir_start=''
             try:
-                start_idx=filenames.index(completion_data['last_dir'])+1
-                if start_idx == len(filenames):
-                    start_idx = 0
-            except (KeyError,ValueError):
-                start_idx = 0
-            for idx in list(range(start_idx,len(filenames))) + list(range(0,start_idx)):
-                full_path = os.path.join(head,filenames[idx])
-                if filenames[idx].lower().startswith(dir_start.lower()) and os.path.isdir(full_path):
-                    completion_data['last_dir'] = filenames[idx]
-                    return full_path
-        except OSError:
-            pass
-        return path
+                directories, files = directory_cache.get(head)
+            except OSError:
+                return path
+            index = completion_data['index'] = CompletionIndex(path, head, dir_start, [entry.name for entry in directories])
+        name = index.next(completion_data.get('last_dir'))
+        if name is None:
+            return path
+        completion_data['last_dir'] = name
+        return os.path.join(index.head, name)
 
     def getBookmarks(self):
-        gtk_bookm = os.path.expanduser("~/.gtk-bookmarks")
-        kde_bookm = os.path.expanduser("~/.kde/share/apps/kfileplaces/bookmarks.xml")
+        """Return bookmarked paths from all the sources"""
         bookmarks = set()
-        try:
-            with open(gtk_bookm) as gtk_fd:
-                for bm in gtk_fd.readlines():
-                    if bm.startswith("file:///"):
-                        bookmarks.add(bm[7:].replace('\n','').decode('utf-8', 'replace'))
-        except IOError:
-            log.info(_('No GTK bookmarks file found'))
-            pass
+        for source in self._bookmarks_sources:
+            bookmarks.update(source.load())
+        return bookmarks
 
-        try:
-            dom = minidom.parse(kde_bookm)
-            for elem in dom.getElementsByTagName('bookmark'):
-                bm = elem.getAttribute("href")
-                if bm.startswith("file:///"):
-                    bookmarks.add(bm[7:].decode('utf-8', 'replace'))
-        except IOError:
-            log.info(_('No KDE bookmarks file found'))
-            pass
+    def _loadBookmarks(self, caller):
+        """Load bookmarks in a thread, and fill the bookmarks list in the main loop"""
+        bookmarks = self.getBookmarks()
+        caller.call(self._setBookmarks, bookmarks)
+        caller.call(caller.close)
 
-        return bookmarks
+    def _setBookmarks(self, bookmarks):
+        self.bookmarks = sorted(bookmarks)
+        widgets = []
+        for bookmark in self.bookmarks:
+            if bookmark.startswith(self.__home_path):
+                bookmark="~"+bookmark[len(self.__home_path):]
+            book_wid = sat_widgets.ClickableText(bookmark)
+            urwid.connect_signal(book_wid, 'click', self.onBookmarkSelected)
+            widgets.append(book_wid)
+        self.bookm_list[:] = widgets
 
     def onBookmarkSelected(self, button):
         self.path_wid.set_edit_text(os.path.expanduser(button.get_text()))
 
     def onPathChange(self, edit, path):
-        if os.path.isdir(path):
-            self.files_wid.showDirectory(path)
+        self._hideSearch()
+        if self.scanner is None:
+            if os.path.isdir(path):
+                self.files_wid.showDirectory(path)
+            return
+        # we wait for the user to stop typing before scanning
+        self.scanner.cancel()
+        if self._scan_alarm is not None:
+            self.loop.remove_alarm(self._scan_alarm)
+        self._scan_alarm = self.loop.set_alarm_in(self.scan_delay, self._startScan, path)
+
+    def _startScan(self, loop, path):
+        self._scan_alarm = None
+        self.scanner.scan(path)
 
     def onPreviousDir(self, wid):
         path = os.path.abspath(self.path_wid.get_edit_text())
@@ -264,5 +1875,11 @@ class FileDialog(urwid.WidgetWrap):
             path = os.path.dirname(path)
         self.path_wid.set_edit_text(os.path.join(path,wid.get_text()))
 
+    def _onCancel(self, wid):
+        self.close()
+        self.cancel_cb(wid)
+
     def onFileClick(self, wid):
+        recent_directories.add(os.path.abspath(self.files_wid.path))
+        self.close()
         self.ok_cb(os.path.abspath(os.path.join(self.files_wid.path,wid.get_text())))
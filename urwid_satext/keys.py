@@ -19,12 +19,140 @@
 
 """This module manage action <==> key mapping and can be extended to add new actions"""
 from functools import reduce
+import configparser
+import json
+import os
+import time
+import logging as log
+try:
+    import tomllib
+except ImportError: # Python < 3.11
+    tomllib = None
 
 
 class ConflictError(Exception):
     pass
 
 
+def normalize_key(key):
+    """Return the canonical form of an urwid key
+
+    modifiers and key names are case insensitive, single characters are not
+    """
+    return key if len(key) == 1 else key.lower()
+
+
+def normalize_shortcut(shortcut):
+    """Return the canonical form of a shortcut
+
+    @param shortcut (str, tuple): a key, or a tuple of keys for a key sequence
+    """
+    if isinstance(shortcut, tuple):
+        return tuple(normalize_key(key) for key in shortcut)
+    return normalize_key(shortcut)
+
+
+def _shortcut_str(shortcut):
+    return ' '.join(shortcut) if isinstance(shortcut, tuple) else shortcut
+
+
+_overrides_cache = {} # key = path, value = (file signature, overrides)
+# a file modified this recently may be modified again without changing its
+# signature (mtime granularity), so its signature can't be trusted yet
+_RACY_DELAY_NS = 2 * 10**9
+
+
+def _file_signature(path):
+    """Return the signature of a file, None if it can't be trusted yet
+
+    @raise OSError: the file can't be read
+    """
+    stat = os.stat(path)
+    if time.time_ns() - stat.st_mtime_ns < _RACY_DELAY_NS:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _parse_shortcut(shortcut, ini=False):
+    if isinstance(shortcut, str):
+        if ini and ',' in shortcut.strip(' ,'):
+            return tuple(key.strip() for key in shortcut.split(','))
+        return shortcut
+    if isinstance(shortcut, list) and shortcut and all(isinstance(key, str) for key in shortcut):
+        return tuple(shortcut)
+    raise ValueError("invalid shortcut: {!r}".format(shortcut))
+
+
+def _read_overrides(path):
+    signature = _file_signature(path)
+    try:
+        cached_signature, overrides = _overrides_cache[path]
+    except KeyError:
+        pass
+    else:
+        if signature is not None and cached_signature == signature:
+            return signature, overrides
+
+    ext = os.path.splitext(path)[1].lower()
+    ini = ext not in ('.json', '.toml')
+    if ext == '.json':
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError("keymap must be a JSON object")
+    elif ext == '.toml':
+        if tomllib is None:
+            raise ValueError("TOML keymaps need Python 3.11 or later")
+        with open(path, 'rb') as f:
+            data = tomllib.load(f)
+    else:
+        parser = configparser.ConfigParser(interpolation=None)
+        parser.optionxform = str # actions are case sensitive
+        try:
+            with open(path, encoding='utf-8') as f:
+                parser.read_file(f)
+        except configparser.Error as e:
+            raise ValueError(str(e))
+        data = {section: dict(parser.items(section)) for section in parser.sections()}
+
+    overrides = {}
+    for name, value in data.items():
+        if isinstance(value, dict):
+            for action, shortcut in value.items():
+                overrides[(name, action)] = _parse_shortcut(shortcut, ini)
+        else:
+            overrides[(None, name)] = _parse_shortcut(value, ini)
+    if signature is None:
+        _overrides_cache.pop(path, None)
+    else:
+        _overrides_cache[path] = (signature, overrides)
+    return signature, overrides
+
+
+def load_overrides(path):
+    """Read shortcuts overrides from a keymap file
+
+    The format is guessed from the extension: .json, .toml, or INI for anything else.
+    Actions are set in sections (or tables) named after their namespace, or at
+    top level (JSON and TOML only), e.g.:
+        [files_management]
+        FILES_SEARCH = ctrl f
+        FILES_SORT = meta o
+    Key sequences are lists in JSON and TOML, and comma separated keys in INI
+    files. They can only be used for actions handled by a KeySequenceMatcher
+    (see ActionMap.accept_sequences), other widgets only check single keys.
+    Printable characters should not be used for actions of widgets containing
+    text fields, as the fields would not get them anymore.
+    Parsed files are cached until they are modified (inode, size or mtime change),
+    files modified in the last seconds are always read.
+    @param path (str): path to the keymap file
+    @return (dict): map of (namespace or None, action) => shortcut
+    @raise ValueError: the file can't be parsed
+    @raise OSError: the file can't be read
+    """
+    return _read_overrides(path)[1]
+
+
 class ActionMap(dict):
     """Object which manage mapping betwwen actions and keys"""
 
@@ -34,6 +162,15 @@ class ActionMap(dict):
         @param source_dict: dictionary-like object with actions to import
         """
         self._namespaces_actions = {} # key = namespace, values (set) = actions
+        self._actions_namespaces = {} # key = action, value (tuple) = namespaces, (None,) if action has no namespace
+        self._shortcuts_index = {} # key = namespace (None for actions without namespace), value = dict shortcut => list of actions, in order of _positions
+        self._positions = {} # key = action, value = order in which actions have been set
+        self._overridden = {} # key = action overridden by load(), value = default shortcut
+        self._loaded = None # (path, overrides) of the last loaded keymap
+        self._sequences_namespaces = set() # namespaces whose actions can use key sequences, None in it for all actions
+        self._watch_loop = None
+        self._watch_alarm = None
+        self.version = 0 # incremented each time a shortcut changes
         self._close_namespaces = tuple()
         self._alway_check_namespaces = None
         if source_dict is not None:
@@ -43,20 +180,53 @@ class ActionMap(dict):
         """set an action avoiding conflicts
 
         @param action (str,tuple): either an action (str) or a (namespace, action) tuple. action without namespace will not be checked by cbeck_namespaces(). namespace can also be a tuple itself, the action will the be assigned to several namespaces.
-        @param shortcut (str): key shortcut for this action
-        @raise: ConflictError if the action already exists
+        @param shortcut (str, tuple): key shortcut for this action, or tuple of keys for a key sequence (see KeySequenceMatcher)
+        @raise: ConflictError if the action already exists, or if the shortcut is already used in a close namespace (see find_conflicts)
         """
+        namespaces, action = self._split_action(action)
+        if action in self:
+            raise ConflictError("The action [{}] already exists".format(action))
+        shortcut = normalize_shortcut(shortcut)
+        self._check_conflicts(action, shortcut, namespaces)
+        self._add(namespaces, action, shortcut)
+
+    @staticmethod
+    def _split_action(action):
+        """Return namespaces and action name of an action as given to __setitem__"""
         if isinstance(action, tuple):
             namespaces, action = action
             if not isinstance(namespaces, tuple):
                 namespaces = (namespaces,)
-            for namespace in namespaces:
-                namespace_map = self._namespaces_actions.setdefault(namespace.lower(), set())
-                namespace_map.add(action)
+            return tuple(namespace.lower() for namespace in namespaces), action
+        return (None,), action
 
-        if action in self:
-            raise ConflictError("The action [{}] already exists".format(action))
-        return super(ActionMap, self).__setitem__(action, shortcut.lower())
+    def _add(self, namespaces, action, shortcut):
+        """Add an action without checking it"""
+        for namespace in namespaces:
+            if namespace is not None:
+                self._namespaces_actions.setdefault(namespace, set()).add(action)
+        self._actions_namespaces[action] = namespaces
+        self._positions[action] = len(self._positions)
+        super(ActionMap, self).__setitem__(action, shortcut)
+        self._index(action, shortcut)
+        self.version += 1
+
+    def _conflicting_actions(self, action, shortcut, namespaces):
+        """Return the other actions using shortcut in namespaces close to the given ones"""
+        namespaces = [namespace for namespace in namespaces if namespace is not None]
+        if not namespaces:
+            # actions without namespace are not checked
+            return set()
+        conflicts = self.find_conflicts(shortcut, namespaces)
+        conflicts.discard(action)
+        return conflicts
+
+    def _check_conflicts(self, action, shortcut, namespaces):
+        """Raise ConflictError if the shortcut of action would conflict with other actions"""
+        conflicts = self._conflicting_actions(action, shortcut, namespaces)
+        if conflicts:
+            raise ConflictError("shortcut [{}] of action [{}] is already used in close namespaces (actions: {})".format(
+                _shortcut_str(shortcut), action, ', '.join(sorted(conflicts))))
 
     def __delitem__(self, action):
         # we don't want to delete actions
@@ -68,26 +238,103 @@ class ActionMap(dict):
         @param action: name of an existing action
         @param shortcut: new shortcut to use
         @raise KeyError: action doesn't exists
+        @raise ConflictError: the shortcut is already used in a close namespace
         """
         assert isinstance(action, str)
         if action not in self:
             raise ValueError("Action [{}] doesn't exist".format(action))
+        shortcut = normalize_shortcut(shortcut)
+        self._check_conflicts(action, shortcut, self._actions_namespaces[action])
+        self._set_shortcut(action, shortcut)
+
+    def _set_shortcut(self, action, shortcut):
+        """Change the shortcut of an existing action without checking it"""
+        self._unindex(action, self[action])
         super(ActionMap, self).__setitem__(action, shortcut)
+        self._index(action, shortcut)
+        self.version += 1
+
+    def _index(self, action, shortcut):
+        for namespace in self._actions_namespaces[action]:
+            shortcuts = self._shortcuts_index.setdefault(namespace, {})
+            actions = shortcuts.setdefault(shortcut, [])
+            actions.append(action)
+            if len(actions) > 1:
+                # order must not depend on shortcuts replacements
+                actions.sort(key=self._positions.__getitem__)
+
+    def _unindex(self, action, shortcut):
+        for namespace in self._actions_namespaces[action]:
+            shortcuts = self._shortcuts_index[namespace]
+            actions = shortcuts[shortcut]
+            actions.remove(action)
+            if not actions:
+                del shortcuts[shortcut]
+
+    def get_action(self, shortcut, namespace=None):
+        """Return the action using a shortcut
+
+        @param shortcut (str, tuple): key or key sequence
+        @param namespace (str, None): namespace of the action, None for actions without namespace
+        @return (str, None): action using this shortcut in the namespace, None if there is none
+            if several actions use it, the first one set is returned (see find_actions)
+        """
+        if namespace is not None:
+            namespace = namespace.lower()
+        try:
+            return self._shortcuts_index[namespace][normalize_shortcut(shortcut)][0]
+        except KeyError:
+            return None
+
+    def find_actions(self, shortcut, namespaces=None):
+        """Return all the actions using a shortcut
+
+        @param shortcut (str, tuple): key or key sequence
+        @param namespaces (iterable, None): namespaces to look into (None in it for actions
+            without namespace), None for all actions
+        @return (list): actions using this shortcut, in the order they have been set
+        """
+        shortcut = normalize_shortcut(shortcut)
+        if namespaces is None:
+            namespaces = self._shortcuts_index
+        else:
+            namespaces = [namespace if namespace is None else namespace.lower() for namespace in namespaces]
+        actions = set()
+        for namespace in namespaces:
+            actions.update(self._shortcuts_index.get(namespace, {}).get(shortcut, ()))
+        return sorted(actions, key=self._positions.__getitem__)
 
     def update(self, new_actions):
         """Update actions with an other dictionary
 
         @param new_actions: dictionary object to update actions
         @raise ValueError: something else than a dictionary is used
-        @raise: ConflictError if at least one of the new actions already exists
+        @raise: ConflictError if at least one of the new actions already exists, or if a shortcut is already used in a close namespace (nothing is added in this case)
         """
         if not isinstance(new_actions, dict):
             raise ValueError("only dictionary subclasses are accepted for update")
-        conflict = new_actions.keys() & self.keys()
+        new_actions = [self._split_action(action) + (normalize_shortcut(shortcut),)
+                       for action, shortcut in new_actions.items()]
+        conflict = {action for namespaces, action, shortcut in new_actions} & self.keys()
         if conflict:
             raise ConflictError("The actions [{}] already exists".format(','.join(conflict)))
-        for action, shortcut in new_actions.items():
-            self[action] = shortcut
+        # new actions are checked before adding any of them
+        pending = {} # shortcut => [(action, namespaces)] of new actions
+        for namespaces, action, shortcut in new_actions:
+            conflicts = self._conflicting_actions(action, shortcut, namespaces)
+            close = set()
+            for namespace in namespaces:
+                if namespace is not None:
+                    close.update(self.get_close_namespaces(namespace))
+            for other_action, other_namespaces in pending.get(shortcut, ()):
+                if not close.isdisjoint(other_namespaces):
+                    conflicts.add(other_action)
+            if conflicts:
+                raise ConflictError("shortcut [{}] of action [{}] is already used in close namespaces (actions: {})".format(
+                    _shortcut_str(shortcut), action, ', '.join(sorted(conflicts))))
+            pending.setdefault(shortcut, []).append((action, namespaces))
+        for namespaces, action, shortcut in new_actions:
+            self._add(namespaces, action, shortcut)
 
     def replace(self, action_shortcuts_map):
         """Replace shortcuts with an other dictionary
@@ -95,11 +342,201 @@ class ActionMap(dict):
         @param action_shortcuts_map: dictionary like object to update shortcuts
         @raise ValueError: something else than a dictionary is used
         @raise KeyError: action doesn't exists
+        @raise ConflictError: a new shortcut is already used in a close namespace, nothing is replaced in this case
         """
         if not isinstance(action_shortcuts_map, dict):
             raise ValueError("only dictionary subclasses are accepted for replacing shortcuts")
+        for action in action_shortcuts_map:
+            if action not in self:
+                raise ValueError("Action [{}] doesn't exist".format(action))
+        # shortcuts may be exchanged, so they are checked once all of them are replaced
+        previous = {action: self[action] for action in action_shortcuts_map}
         for action, shortcut in action_shortcuts_map.items():
-            self.replace_shortcut(action, shortcut)
+            self._set_shortcut(action, normalize_shortcut(shortcut))
+        for action in action_shortcuts_map:
+            try:
+                self._check_conflicts(action, self[action], self._actions_namespaces[action])
+            except ConflictError:
+                for previous_action, shortcut in previous.items():
+                    self._set_shortcut(previous_action, shortcut)
+                raise
+
+    def get_actions(self, namespaces=None):
+        """Return actions of some namespaces
+
+        @param namespaces (iterable, None): namespaces to use, None for all actions
+        @return (set): actions
+        """
+        if namespaces is None:
+            return set(self)
+        actions = set()
+        for namespace in namespaces:
+            actions.update(self._namespaces_actions.get(namespace.lower(), ()))
+        return actions
+
+    def accept_sequences(self, namespaces=None):
+        """Allow key sequences for actions of some namespaces in keymap files
+
+        this is done by KeySequenceMatcher, which handles sequences of these actions
+        @param namespaces (iterable, None): namespaces of the actions, None for all actions
+        """
+        if namespaces is None:
+            self._sequences_namespaces.add(None)
+        else:
+            self._sequences_namespaces.update(namespace.lower() for namespace in namespaces)
+
+    def accepts_sequence(self, action):
+        """Tell if an action can use a key sequence in keymap files
+
+        @param action (str): action to check
+        @return (bool): True if a KeySequenceMatcher handles this action
+        """
+        if None in self._sequences_namespaces:
+            return True
+        return not self._sequences_namespaces.isdisjoint(self._actions_namespaces[action])
+
+    def get_namespaces(self, action):
+        """Return namespaces of an action
+
+        @param action (str): action to check
+        @return (tuple): namespaces of the action, (None,) if it has no namespace
+        @raise KeyError: action doesn't exist
+        """
+        return self._actions_namespaces[action]
+
+    def get_close_namespaces(self, namespace):
+        """Return namespaces where shortcuts of a namespace should not be used
+
+        @param namespace (str): namespace to check
+        @return (set): close namespaces, including namespace itself
+        """
+        namespace = namespace.lower()
+        always_check = self._alway_check_namespaces or ()
+        if namespace in always_check:
+            return set(self._namespaces_actions)
+        close = {namespace}
+        close.update(always_check)
+        for close_namespaces in self._close_namespaces:
+            if namespace in close_namespaces:
+                close.update(close_namespaces)
+        return close
+
+    def find_conflicts(self, shortcut, namespaces):
+        """Return actions which would conflict with a new action
+
+        @param shortcut (str, tuple): shortcut of the new action
+        @param namespaces (iterable): namespaces of the new action
+        @return (set): actions of close namespaces using the shortcut
+        """
+        shortcut = normalize_shortcut(shortcut)
+        close = set()
+        for namespace in namespaces:
+            close.update(self.get_close_namespaces(namespace))
+        actions = set()
+        for namespace in close:
+            actions.update(self._shortcuts_index.get(namespace, {}).get(shortcut, ()))
+        return actions
+
+    def _clone(self, shortcuts):
+        """Return a new map with the same actions and namespaces
+
+        @param shortcuts (dict): map of action => shortcut to use
+        """
+        new_map = type(self)()
+        for action in self:
+            # conflicts are reported all at once by check_namespaces
+            new_map._add(self._actions_namespaces[action], action, normalize_shortcut(shortcuts[action]))
+        new_map._close_namespaces = self._close_namespaces
+        new_map._alway_check_namespaces = self._alway_check_namespaces
+        return new_map
+
+    def _swap(self, new_map):
+        """Use shortcuts of new_map instead of current ones
+
+        the map itself is kept, so widgets using it get new shortcuts on next key
+        """
+        super(ActionMap, self).clear()
+        super(ActionMap, self).update(new_map)
+        self._namespaces_actions = new_map._namespaces_actions
+        self._actions_namespaces = new_map._actions_namespaces
+        self._shortcuts_index = new_map._shortcuts_index
+        self._positions = new_map._positions
+        self.version += 1
+
+    def load(self, path):
+        """Replace shortcuts with the ones of a keymap file
+
+        Shortcuts overridden by a previous load but not in the file anymore get their default value back.
+        The new shortcuts are checked with check_namespaces, and current ones are kept if they are invalid.
+        @param path (str): path to the keymap file (see load_overrides)
+        @return (bool): True if shortcuts have been replaced, False if the file was already loaded
+            (current shortcuts are checked again in this case)
+        @raise ValueError: the file is invalid, uses unknown actions, or key sequences
+            for actions which don't accept them (see accept_sequences)
+        @raise ConflictError: the new shortcuts are conflicting
+        @raise OSError: the file can't be read
+        """
+        overrides = _read_overrides(path)[1]
+        if self._loaded == (path, overrides):
+            self.check_namespaces()
+            return False
+        shortcuts = dict(self)
+        shortcuts.update(self._overridden)
+        overridden = {}
+        for (namespace, action), shortcut in overrides.items():
+            if action not in self:
+                raise ValueError("Action [{}] doesn't exist".format(action))
+            if namespace is not None and namespace.lower() not in self._actions_namespaces[action]:
+                raise ValueError('Action [{}] is not in namespace "{}"'.format(action, namespace))
+            if isinstance(shortcut, tuple) and not self.accepts_sequence(action):
+                raise ValueError("Action [{}] can't use the key sequence [{}], only single keys are handled for it".format(
+                    action, _shortcut_str(shortcut)))
+            overridden[action] = shortcuts[action]
+            shortcuts[action] = shortcut
+        new_map = self._clone(shortcuts)
+        new_map.check_namespaces()
+        self._swap(new_map)
+        self._overridden = overridden
+        self._loaded = (path, overrides)
+        return True
+
+    def watch(self, loop, path, interval=2.0):
+        """Load a keymap file, and load it again each time it changes
+
+        The file is checked with loop's alarms, so shortcuts are only replaced
+        between two keys. Invalid files are logged and ignored.
+        @param loop (urwid.MainLoop): loop to use
+        @param path (str): path to the keymap file
+        @param interval (float): seconds between two checks
+        """
+        self.unwatch()
+        last_signature = [None]
+
+        def check(loop, user_data):
+            self._watch_alarm = loop.set_alarm_in(interval, check)
+            try:
+                signature = _file_signature(path)
+            except OSError:
+                # the file may be being replaced
+                return
+            if signature is not None and signature == last_signature[0]:
+                return
+            last_signature[0] = signature
+            try:
+                if self.load(path):
+                    log.info("keymap {} loaded".format(path))
+            except (OSError, ValueError, ConflictError) as e:
+                log.warning("can't load keymap {}: {}".format(path, e))
+
+        self._watch_loop = loop
+        check(loop, None)
+
+    def unwatch(self):
+        """Stop watching the keymap file set with watch"""
+        if self._watch_alarm is not None:
+            self._watch_loop.remove_alarm(self._watch_alarm)
+            self._watch_alarm = None
+            self._watch_loop = None
 
     def set_close_namespaces(self, close_namespaces, always_check=None):
         """Set namespaces where conflicting shortcut should not happen
@@ -111,45 +548,239 @@ class ActionMap(dict):
         assert isinstance(close_namespaces, tuple)
         if always_check is not None:
             assert isinstance(always_check, tuple)
-        to_check = reduce(lambda ns1, ns2: ns1.union(ns2), close_namespaces, set(always_check) or set())
+        to_check = reduce(lambda ns1, ns2: ns1.union(ns2), close_namespaces, set(always_check or ()))
         if not to_check.issubset(self._namespaces_actions):
             raise ValueError("Unkown namespaces: {}".format(', '.join(to_check.difference(self._namespaces_actions))))
         self._close_namespaces = close_namespaces
         self._alway_check_namespaces = always_check
 
+    def get_conflicts(self):
+        """Find all shortcuts used by several actions in close namespaces
+
+        @return (list): list of (shortcut, namespaces, actions) tuples, where
+            namespaces and actions are sorted tuples
+        """
+        always_check = tuple(self._alway_check_namespaces or ())
+        groups = [set(close_namespaces + always_check) for close_namespaces in self._close_namespaces]
+        checked = set().union(*groups)
+        groups.extend({namespace}.union(always_check)
+                      for namespace in set(self._namespaces_actions).difference(checked))
+        conflicts = {}
+        for group in groups:
+            used = {} # shortcut => {action: namespace}
+            for namespace in sorted(group):
+                for shortcut, actions in self._shortcuts_index.get(namespace, {}).items():
+                    shortcut_actions = used.setdefault(shortcut, {})
+                    for action in actions:
+                        shortcut_actions.setdefault(action, namespace)
+            for shortcut, shortcut_actions in used.items():
+                if len(shortcut_actions) > 1:
+                    key = (shortcut, frozenset(shortcut_actions))
+                    conflicts[key] = (shortcut,
+                                      tuple(sorted(set(shortcut_actions.values()))),
+                                      tuple(sorted(shortcut_actions)))
+        return sorted(conflicts.values(), key=lambda conflict: (_shortcut_str(conflict[0]), conflict[1:]))
+
     def check_namespaces(self):
-        """Check that shortcuts are not conflicting in close namespaces"""
-        # we first check each namespace individually
-        checked = set()
-
-        def check_namespaces(namespaces):
-            # for each namespace which save keys used
-            # if 1 key is used several times, we raise
-            # a ConflictError
-            set_shortcuts = {}
-
-            to_check = set(namespaces + self._alway_check_namespaces)
-
-            for namespace in to_check:
-                checked.add(namespace)
-                for action in self._namespaces_actions[namespace]:
-                    shortcut = self[action]
-                    if shortcut in set_shortcuts:
-                        set_namespace = set_shortcuts[shortcut]
-                        if set_namespace == namespace:
-                            msg = 'shortcut [{}] is not unique in namespace "{}"'.format(shortcut, namespace)
-                        else:
-                            msg = 'shortcut [{}] is used both in namespaces "{}" and "{}"'.format(shortcut, set_namespace, namespace)
-                        raise ConflictError(msg)
-                    set_shortcuts[shortcut] = namespace
-
-        # we first check close namespaces
-        for close_namespaces in self._close_namespaces:
-            check_namespaces(close_namespaces)
+        """Check that shortcuts are not conflicting in close namespaces
+
+        @raise ConflictError: at least one shortcut is conflicting, the message lists all of them
+        """
+        msgs = []
+        for shortcut, namespaces, actions in self.get_conflicts():
+            if len(namespaces) == 1:
+                msg = 'shortcut [{}] is not unique in namespace "{}"'.format(_shortcut_str(shortcut), namespaces[0])
+            else:
+                msg = 'shortcut [{}] is used in namespaces {}'.format(
+                    _shortcut_str(shortcut), ', '.join('"{}"'.format(namespace) for namespace in namespaces))
+            msgs.append('{} (actions: {})'.format(msg, ', '.join(actions)))
+        if msgs:
+            raise ConflictError('\n'.join(msgs))
+
+
+class _KeyNode(object):
+    """Node of KeySequenceMatcher's trie"""
+    __slots__ = ('children', 'action')
+
+    def __init__(self):
+        self.children = {} # key => _KeyNode
+        self.action = None
+
+
+class KeySequenceMatcher(object):
+    """Match key sequences (e.g. vim like "g g", "d d" or "3 j") of an ActionMap
+
+    Shortcuts which are tuples of keys are sequences, other ones are sequences
+    of one key. Sequences are kept in a trie, and each key advances one node.
+    When actions of independent namespaces use the same sequence, the first
+    one in namespaces order (then in the order actions have been set) is used.
+    When a sequence is also the prefix of longer ones, its action is called if no
+    other key is pressed during timeout seconds.
+    unhandled_input can be used as MainLoop's unhandled_input.
+    """
+    timeout = 1.0 # seconds to wait for next key after an ambiguous prefix
+    LEADER = '<leader>' # replaced by the leader key in sequences
+
+    def __init__(self, action_map, callback, namespaces=None, loop=None, leader=None, counts=True, fallback=None):
+        """
+        @param action_map (ActionMap): map to take shortcuts from
+        @param callback (callable): called with action and count (int, or None if
+            no count has been typed) when a sequence is matched
+        @param namespaces (iterable, None): only use actions from these namespaces,
+            None to use all actions
+        @param loop (urwid.MainLoop, None): loop used for ambiguous prefixes timeout,
+            if None the next key is always waited for
+        @param leader (str, None): key used instead of LEADER in sequences
+        @param counts (bool): if True, digits typed before a sequence are a count
+        @param fallback (callable, None): called with keys which are not part of
+            a sequence
+        """
+        self.action_map = action_map
+        self.callback = callback
+        self.namespaces = namespaces
+        self.loop = loop
+        self.leader = leader
+        self.counts = counts
+        self.fallback = fallback
+        self._alarm = None
+        action_map.accept_sequences(namespaces)
+        self.build()
+
+    def _ordered_actions(self):
+        """Return the actions to use, the ones to use first in case of duplicates first"""
+        action_map = self.action_map
+        actions = action_map.get_actions(self.namespaces)
+        # ActionMap keeps the order in which actions have been set
+        ordered = [action for action in action_map if action in actions]
+        if self.namespaces is not None:
+            ranks = {}
+            for namespace in self.namespaces:
+                ranks.setdefault(namespace.lower(), len(ranks))
+            ordered.sort(key=lambda action: min(ranks.get(namespace, len(ranks))
+                                                for namespace in action_map.get_namespaces(action)))
+        return ordered
+
+    def _are_close(self, action, other_action):
+        """Tell if two actions are in close namespaces (see ActionMap.set_close_namespaces)"""
+        other_namespaces = set(self.action_map.get_namespaces(other_action))
+        for namespace in self.action_map.get_namespaces(action):
+            if namespace is not None and not other_namespaces.isdisjoint(self.action_map.get_close_namespaces(namespace)):
+                return True
+        return False
+
+    def build(self):
+        """Build the trie, it is done again automatically when shortcuts change
+
+        @raise ConflictError: the same sequence is used by two actions of close namespaces
+        @raise ValueError: a sequence uses LEADER but no leader is set
+        """
+        root = _KeyNode()
+        for action in self._ordered_actions():
+            sequence = self.action_map[action]
+            if not isinstance(sequence, tuple):
+                sequence = (sequence,)
+            if self.LEADER in sequence:
+                if self.leader is None:
+                    raise ValueError("action [{}] uses the leader key, but none is set".format(action))
+                sequence = tuple(self.leader if key == self.LEADER else key for key in sequence)
+            node = root
+            for key in sequence:
+                node = node.children.setdefault(key, _KeyNode())
+            if node.action is not None:
+                if self._are_close(node.action, action):
+                    raise ConflictError("shortcut [{}] is used by actions [{}] and [{}]".format(
+                        ' '.join(sequence), node.action, action))
+                log.debug("shortcut [{}] is used by actions [{}] and [{}], [{}] is used".format(
+                    ' '.join(sequence), node.action, action, node.action))
+                continue
+            node.action = action
+        self._root = root
+        self._version = self.action_map.version
+        self.reset()
+
+    def reset(self):
+        """Forget the keys typed so far"""
+        self._cancel_timeout()
+        self._node = self._root
+        self._keys = []
+        self._count = ''
+
+    def _cancel_timeout(self):
+        if self._alarm is not None:
+            self.loop.remove_alarm(self._alarm)
+            self._alarm = None
+
+    def _on_timeout(self, loop, user_data):
+        self._alarm = None
+        if self._node.action is not None:
+            self._fire(self._node.action)
+        else:
+            self._flush()
+
+    def _fire(self, action):
+        count = int(self._count) if self._count else None
+        self.reset()
+        self.callback(action, count)
+
+    def _flush(self):
+        """Give the keys typed so far to the fallback"""
+        keys = self._keys
+        self.reset()
+        if self.fallback is not None:
+            for key in keys:
+                self.fallback(key)
+
+    def feed(self, key):
+        """Advance in the key sequences with a key
+
+        @param key: key as given by urwid
+        @return (bool): True if the key is used by a sequence
+        """
+        self._cancel_timeout()
+        if self._version != self.action_map.version and self._node is self._root and not self._count:
+            # shortcuts have changed
+            try:
+                self.build()
+            except (ConflictError, ValueError) as e:
+                # we keep the current trie, and don't try again until next change
+                log.warning("can't use the new shortcuts for key sequences: {}".format(e))
+                self._version = self.action_map.version
+        node = self._node
+        root = self._root
+        if (node is root and self.counts and isinstance(key, str) and len(key) == 1
+            and key.isdigit() and (self._count or (key != '0' and key not in root.children))):
+            self._count += key
+            self._keys.append(key)
+            return True
+        try:
+            child = node.children.get(key)
+        except TypeError:
+            # key is not hashable
+            child = None
+        if child is None:
+            if node is not root and node.action is not None:
+                # the pending sequence is complete, and key may start a new one
+                self._fire(node.action)
+                return self.feed(key)
+            if node is not root or self._count:
+                # the pending keys don't make a sequence
+                self._flush()
+                return self.feed(key)
+            if self.fallback is not None:
+                self.fallback(key)
+            return False
+        if not child.children:
+            self._fire(child.action)
+            return True
+        self._node = child
+        self._keys.append(key)
+        if self.loop is not None:
+            self._alarm = self.loop.set_alarm_in(self.timeout, self._on_timeout)
+        return True
 
-        # then the remaining ones
-        for namespace in set(self._namespaces_actions.keys()).difference(checked):
-            check_namespaces((namespace,))
+    def unhandled_input(self, key):
+        """Method to use as MainLoop's unhandled_input"""
+        return self.feed(key)
 
 
 keys = {
@@ -180,6 +811,9 @@ keys = {
         ('files_management', "FILES_HIDDEN_HIDE"): 'meta h',
         ('files_management', "FILES_JUMP_DIRECTORIES"): 'meta d',
         ('files_management', "FILES_JUMP_FILES"): 'meta f',
+        ('files_management', "FILES_SORT"): 'meta s',
+        ('files_management', "FILES_SORT_REVERSE"): 'meta r',
+        ('files_management', "FILES_SEARCH"): 'meta /',
        }
 
 action_key_map = ActionMap(keys)
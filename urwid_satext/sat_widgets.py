@@ -25,16 +25,19 @@ utf8decode = lambda s: encodings.codecs.utf_8_decode(s)[0]
 import uuid
 
 import collections
+import contextlib
+import bisect
 
 from urwid.util import is_mouse_press #XXX: is_mouse_press is not included in urwid in 1.0.0
 from .keys import action_key_map as a_key
 
-FOCUS_KEYS = (a_key['FOCUS_SWITCH'], a_key['FOCUS_UP'], a_key['FOCUS_DOWN'])
+FOCUS_ACTIONS = ('FOCUS_SWITCH', 'FOCUS_UP', 'FOCUS_DOWN')
+FOCUS_KEYS = tuple(a_key[action] for action in FOCUS_ACTIONS) # default keys, shortcuts may be changed later
 
 
 def getFocusDirection(key, inversed=False):
     """Return direction and rotate boolean depending on key
-    @param key: one of FOCUS_KEYS
+    @param key: a key of one of FOCUS_ACTIONS
     @param inversed: inverse directions if True
     @return (tuple): (direction, rotate) where
         - direction is 1 or -1
@@ -78,21 +81,22 @@ class AdvancedEdit(urwid.Edit):
 
     def keypress(self, size, key):
         #TODO: insert mode is not managed yet
-        if key == a_key['EDIT_HOME']:
+        action = a_key.get_action(key, 'edit')
+        if action == 'EDIT_HOME':
             key = 'home'
-        elif key == a_key['EDIT_END']:
+        elif action == 'EDIT_END':
             key = 'end'
-        elif key == a_key['EDIT_DELETE_TO_END']:
+        elif action == 'EDIT_DELETE_TO_END':
             self._delete_highlighted()
             self.set_edit_text(self.edit_text[:self.edit_pos])
-        elif key == a_key['EDIT_DELETE_LAST_WORD']:
+        elif action == 'EDIT_DELETE_LAST_WORD':
             before = self.edit_text[:self.edit_pos]
             pos = before.rstrip().rfind(" ")+1
             self.set_edit_text(before[:pos] + self.edit_text[self.edit_pos:])
             self.set_edit_pos(pos)
-        elif key == a_key['EDIT_ENTER']:
+        elif action == 'EDIT_ENTER':
             self._emit('click')
-        elif key == a_key['EDIT_COMPLETE']:
+        elif action == 'EDIT_COMPLETE':
             try:
                 before = self.edit_text[:self.edit_pos]
                 if self.completion_data:
@@ -195,7 +199,7 @@ class SurroundedText(urwid.Widget):
     """Text centered on a repeated character (like a Divider, but with a text in the center)"""
     _sizing = frozenset(['flow'])
 
-    def __init__(self,text,car=('─').encode("utf-8")):
+    def __init__(self,text,car='─'):
         self.text=text
         self.car=car
 
@@ -207,14 +211,19 @@ class SurroundedText(urwid.Widget):
 
     def display_widget(self, size, focus):
         (maxcol,) = size
-        middle = (maxcol-len(self.text))/2
+        middle = (maxcol-len(self.text))//2
         render_text = middle * self.car + self.text + (maxcol - len(self.text) - middle) * self.car
         return urwid.Text(render_text)
 
 
 class AlwaysSelectableText(urwid.WidgetWrap):
     """Text which can be selected with space"""
-    signals = ['change']
+    signals = ['change', 'text_change']
+    max_canvases = 4 # number of canvases kept in cache
+    # following caches are only set on instances when used
+    _value = None
+    _focus_runs = None
+    _canvases = None # (size, focus) => canvas of the inner Text
 
     def __init__(self, text, align='left', header='', focus_attr='default_focus', selected_text=None, selected=False, data=None):
         """
@@ -225,24 +234,30 @@ class AlwaysSelectableText(urwid.WidgetWrap):
         """
         self.focus_attr = focus_attr
         self._selected = False
-        self._was_focused = False
         self.header = header
         self.text = text
         urwid.WidgetWrap.__init__(self, urwid.Text("",align=align))
         self.setSelectedText(selected_text)
         self.setState(selected)
 
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        self._text = text
+        if self._value is not None:
+            self._value = None
+
     def getValue(self):
-        if isinstance(self.text,str):
-            return self.text
-        list_attr = self.text if isinstance(self.text, list) else [self.text]
-        txt = ""
-        for attr in list_attr:
-            if isinstance(attr,tuple):
-                txt+=attr[1]
+        if self._value is None:
+            if isinstance(self._text,str):
+                self._value = self._text
             else:
-                txt+=attr
-        return txt
+                list_attr = self._text if isinstance(self._text, list) else [self._text]
+                self._value = "".join(attr[1] if isinstance(attr,tuple) else attr for attr in list_attr)
+        return self._value
 
     def get_text(self):
         """for compatibility with urwid.Text"""
@@ -252,6 +267,7 @@ class AlwaysSelectableText(urwid.WidgetWrap):
         """/!\ set_text doesn't change self.selected_txt !"""
         self.text = text
         self.setState(self._selected,invisible=True)
+        self._emit('text_change')
 
     def setSelectedText(self, text=None):
         """Text to display when selected
@@ -261,6 +277,7 @@ class AlwaysSelectableText(urwid.WidgetWrap):
         self.selected_txt = text
         if self._selected:
             self.setState(self._selected)
+        self._emit('text_change')
 
     def _set_txt(self):
         txt_list = [self.header]
@@ -269,7 +286,13 @@ class AlwaysSelectableText(urwid.WidgetWrap):
             txt_list.extend(txt)
         else:
             txt_list.append(txt)
-        self._w.base_widget.set_text(txt_list)
+        text_wid = self._w.base_widget
+        text_wid.set_text(txt_list)
+        self._runs = text_wid.get_text()[1]
+        if self._focus_runs is not None:
+            self._focus_runs = None # computed again on next focused render
+        if self._canvases:
+            self._canvases.clear()
 
 
     def setState(self, selected, invisible=False):
@@ -281,7 +304,6 @@ class AlwaysSelectableText(urwid.WidgetWrap):
         assert type(selected)==bool
         self._selected=selected
         self._set_txt()
-        self._was_focused = False
         self._invalidate()
         if not invisible:
             self._emit("change", self._selected)
@@ -289,6 +311,17 @@ class AlwaysSelectableText(urwid.WidgetWrap):
     def getState(self):
         return self._selected
 
+    def recycle(self, text, selected=False):
+        """Reuse the widget to show an other text, without emitting any signal
+
+        @param text: same as urwid.Text's text parameter
+        @param selected: is the text selected ?
+        """
+        self.text = text
+        self._selected = False
+        self.selected_txt = ('selected', self.getValue())
+        self.setState(selected, invisible=True)
+
     def selectable(self):
         return True
 
@@ -305,29 +338,43 @@ class AlwaysSelectableText(urwid.WidgetWrap):
 
         return False
 
+    def _getFocusRuns(self):
+        """Return attribute runs of the text when focused"""
+        if self._focus_runs is None:
+            if not self._runs:
+                self._focus_runs = [(self.focus_attr, len(self._w.base_widget.text))]
+            else:
+                focus_runs = self._focus_runs = []
+                for attr, attr_len in self._runs:
+                    if attr == None:
+                        attr = self.focus_attr
+                    elif not attr.endswith('_focus'):
+                        attr += "_focus"
+                    focus_runs.append((attr, attr_len))
+        return self._focus_runs
+
     def render(self, size, focus=False):
-        attr_list = self._w.base_widget._attrib
-        if not focus:
-            if self._was_focused:
-                self._set_txt()
-                self._was_focused = False
+        # canvases are kept for both focus states, so moving the focus through a
+        # list doesn't render rows again
+        key = (size, focus)
+        canvases = self._canvases
+        if canvases is None:
+            canvases = self._canvases = {}
         else:
-            if not self._was_focused:
-                if not attr_list:
-                    attr_list.append((self.focus_attr,len(self._w.base_widget.text)))
-                else:
-                    for idx in range(len(attr_list)):
-                        attr,attr_len = attr_list[idx]
-                        if attr == None:
-                            attr = self.focus_attr
-                            attr_list[idx] = (attr,attr_len)
-                        else:
-                            if not attr.endswith('_focus'):
-                                attr+="_focus"
-                                attr_list[idx] = (attr,attr_len)
-                self._w.base_widget._invalidate()
-                self._was_focused = True #bloody ugly hack :)
-        return self._w.render(size, focus)
+            try:
+                return canvases[key]
+            except KeyError:
+                pass
+        runs = self._getFocusRuns() if focus else self._runs
+        text_wid = self._w.base_widget
+        if text_wid.get_text()[1] is not runs:
+            # only attributes change, the cached text layout stays valid
+            text_wid._attrib = runs
+            urwid.Widget._invalidate(text_wid)
+        if len(canvases) >= self.max_canvases:
+            canvases.clear()
+        canvas = canvases[key] = self._w.render(size, focus)
+        return canvas
 
 
 class SelectableText(AlwaysSelectableText):
@@ -378,6 +425,9 @@ class ListOption(str):
         - basestring (label = value = given string)
         - a tuple with (value, label)
     XXX: comparaison is made against value, not the label which is the one displayed
+
+    The value is only stored when it differs from the label, so most options
+    never get an instance dictionary and cost no more than their label.
     """
 
     def __new__(cls, option):
@@ -392,28 +442,30 @@ class ListOption(str):
         if not label:
             label = value
         instance = super(ListOption, cls).__new__(cls, label)
-        instance._value = value
+        if type(value) is not str or value != label:
+            # a dict built with its content is smaller than one grown by setattr
+            instance.__dict__ = {'_value': value}
         return instance
 
     def __eq__(self, other):
-        # XXX: try to compare values, if other has no value
-        #      (e.g. unicode string) try to compare to other itself
-        try:
-            return self._value == other._value
-        except AttributeError:
-            return self._value == other
+        # XXX: compare values, if other has no value
+        #      (e.g. unicode string) compare to other itself
+        return self.value == (other.value if isinstance(other, ListOption) else other)
 
     def __ne__(self, other):
         # XXX: see __eq__
-        try:
-            return self._value != other._value
-        except AttributeError:
-            return self._value != other
+        return self.value != (other.value if isinstance(other, ListOption) else other)
+
+    def __hash__(self):
+        return hash(self.value)
 
     @property
     def value(self):
         """ return option value """
-        return self._value
+        try:
+            return self._value
+        except AttributeError:
+            return str(self)
 
     @value.setter
     def value(self, value):
@@ -422,81 +474,429 @@ class ListOption(str):
     @staticmethod
     def fromOptions(options):
         """ convert a list of string/tuple options to a list of listOption
+
+        options which are already ListOption are kept, and options whose value is
+        their label are interned: equal labels share the same ListOption
         @param options: list of managed option type (basestring, tuple)
-        return: list of ListOption
+        return: new list of ListOption
+        """
+        interned = {}
+        ret = []
+        for option in options:
+            if type(option) is str:
+                try:
+                    option = interned[option]
+                except KeyError:
+                    option = interned[option] = ListOption(option)
+            elif not isinstance(option, ListOption):
+                option = ListOption(option)
+            ret.append(option)
+        return ret
+
+
+class RowMetrics(object):
+    """Rows heights of the widgets of a list box, for a given width
+
+    Prefix sums of heights are kept in a Fenwick tree, so the row offset of a
+    widget, the widget shown at a row, and the update of one height are O(log n).
+    """
+
+    def __init__(self):
+        self.maxcol = None
+        self.total = 0 # total number of rows
+        self.selectable_count = 0 # number of selectable widgets
+        self._widgets = []
+        self._heights = []
+        self._selectables = []
+        self._tree = [0]
+
+    def __len__(self):
+        return len(self._widgets)
+
+    def _buildTree(self):
+        """Build the Fenwick tree and the total from heights"""
+        tree = [0] + self._heights
+        length = len(tree)
+        for idx in range(1, length):
+            parent = idx + (idx & -idx)
+            if parent < length:
+                tree[parent] += tree[idx]
+        self._tree = tree
+        self.total = sum(self._heights)
+
+    def update(self, widgets, maxcol):
+        """Update metrics for new widgets or width
+
+        only widgets which were not there before are measured
+        @param widgets(iterable): widgets of the list box, in order
+        @param maxcol(int): width of the list box
+        """
+        widgets = list(widgets)
+        if maxcol == self.maxcol and widgets == self._widgets:
+            return
+        known = {}
+        if maxcol == self.maxcol:
+            known = {id(widget): height for widget, height in zip(self._widgets, self._heights)}
+        heights = []
+        for widget in widgets:
+            height = known.get(id(widget))
+            if height is None:
+                height = widget.rows((maxcol,), False)
+            heights.append(height)
+        self.maxcol = maxcol
+        self._widgets = widgets
+        self._heights = heights
+        self._selectables = [widget.selectable() for widget in widgets]
+        self.selectable_count = sum(self._selectables)
+        self._buildTree()
+
+    def replace(self, start, removed, widgets):
+        """Replace metrics of some widgets, after a change of the list
+
+        only the given widgets are measured, heights are patched in place when
+        the number of widgets doesn't change, or when widgets are added or removed
+        at the end
+        @param start(int): position of the first changed widget
+        @param removed(int): number of widgets removed at start
+        @param widgets(list): widgets added at start
         """
-        return [(ListOption(option)) for option in options]
+        if self.maxcol is None:
+            # never measured, update will do everything
+            return
+        end = start + removed
+        heights = [widget.rows((self.maxcol,), False) for widget in widgets]
+        selectables = [widget.selectable() for widget in widgets]
+        self.selectable_count += sum(selectables) - sum(self._selectables[start:end])
+        self._widgets[start:end] = widgets
+        self._selectables[start:end] = selectables
+        if removed == len(widgets):
+            for position, height in enumerate(heights, start):
+                self.setHeight(position, height)
+        elif end == len(self._heights):
+            # change at the end: the tree nodes before start stay valid
+            self.total -= sum(self._heights[start:])
+            del self._heights[start:]
+            del self._tree[start + 1:]
+            for height in heights:
+                self._append(height)
+        else:
+            self._heights[start:end] = heights
+            self._buildTree()
+
+    def _append(self, height):
+        """Add a widget height at the end"""
+        tree = self._tree
+        idx = len(tree)
+        node = height
+        child = idx - 1
+        lowest = idx - (idx & -idx)
+        while child > lowest:
+            node += tree[child]
+            child -= child & -child
+        tree.append(node)
+        self._heights.append(height)
+        self.total += height
+
+    def setHeight(self, position, height, selectable=None):
+        """Change the height of one widget
+
+        @param selectable(bool, None): new selectable state of the widget, None to keep it
+        """
+        if selectable is not None and selectable != self._selectables[position]:
+            self._selectables[position] = selectable
+            self.selectable_count += 1 if selectable else -1
+        delta = height - self._heights[position]
+        if not delta:
+            return
+        self._heights[position] = height
+        self.total += delta
+        tree = self._tree
+        idx = position + 1
+        while idx < len(tree):
+            tree[idx] += delta
+            idx += idx & -idx
+
+    def offset(self, position):
+        """Return the number of rows before the widget at position"""
+        tree = self._tree
+        total = 0
+        idx = position
+        while idx > 0:
+            total += tree[idx]
+            idx -= idx & -idx
+        return total
+
+    def find(self, row):
+        """Return the position of the widget shown at the given row
+
+        @param row(int): row from the top of the list, must be lower than total
+        """
+        tree = self._tree
+        position = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            idx = position + step
+            if idx < len(tree) and tree[idx] <= row:
+                position = idx
+                row -= tree[idx]
+            step >>= 1
+        return position
 
 
 class UnselectableListBox(urwid.ListBox):
-    """List box that can be unselectable if all widget are unselectable and visible"""
+    """List box that can be unselectable if all widget are unselectable and visible
+
+    Rows heights are kept in a RowMetrics instance, updated when shown widgets
+    change their height, and when the body is modified. With a PositionsListWalker
+    body, only the changed widgets are measured again, and focus changes are ignored;
+    with other walkers every "modified" signal leads to a full update.
+    """
 
     def __init__(self, body):
         super(UnselectableListBox, self).__init__(body)
         self.__size_cache = None
+        self.__visible_cache = None
+        self.metrics = RowMetrics()
+        self._metrics_dirty = True
+        try:
+            urwid.connect_signal(self.body, 'contents_change', self._onBodyChange)
+        except NameError:
+            try:
+                urwid.connect_signal(self.body, 'modified', self._onBodyModified)
+            except NameError:
+                pass
+
+    def _onBodyModified(self):
+        self._metrics_dirty = True
+
+    def _onBodyChange(self, start, removed, added):
+        if not self._metrics_dirty:
+            self.metrics.replace(start, removed, self.body[start:start+added])
+
+    def getMetrics(self, maxcol):
+        """Return up to date metrics for the given width"""
+        if self._metrics_dirty or self.metrics.maxcol != maxcol:
+            self._metrics_dirty = False
+            self.metrics.update(self.body, maxcol)
+        return self.metrics
 
     def selectable(self):
         """Selectable that return False if everything is visible and nothing is selectable"""
         if self.__size_cache is None:
             return self._selectable
-        middle, top, bottom = self.calculate_visible(self.__size_cache, self.__focus_cache)
-        if top is None or bottom is None:
-            return True
-        if top[0] or bottom[0]:
+        maxcol, maxrow = self.__size_cache
+        metrics = self.getMetrics(maxcol)
+        if not len(metrics) or metrics.total > maxrow:
             # if not everything is visible, we can select
             return True
-        for wid in self.body:
-            # if any widget is selectable, we can select
-            if wid.selectable():
-                return True
-        return False
+        # if any widget is selectable, we can select
+        return metrics.selectable_count > 0
+
+    def calculate_visible(self, size, focus=False):
+        visible = super(UnselectableListBox, self).calculate_visible(size, focus)
+        self.__visible_cache = visible
+        return visible
 
     def render(self, size, focus=False):
         """Call ListBox render, but keep size and focus in cache"""
         self.__size_cache = size
         self.__focus_cache = focus
-        return super(UnselectableListBox, self).render(size, focus)
+        self.__visible_cache = None
+        canvas = super(UnselectableListBox, self).render(size, focus)
+        visible, self.__visible_cache = self.__visible_cache, None
+        if visible is None:
+            return canvas
+        # shown widgets have just been measured by ListBox, we fix heights which changed
+        metrics = self.getMetrics(size[0])
+        middle, top, bottom = visible
+        if middle is not None and len(metrics):
+            shown = [middle[1:4]] + top[1] + bottom[1]
+            for widget, position, rows in shown:
+                if isinstance(position, int) and position < len(metrics):
+                    metrics.setHeight(position, rows, widget.selectable())
+        return canvas
+
+    def getScrollPosition(self, size, focus=False):
+        """Return the scroll state of the list box
+
+        @param size(tuple): (maxcol, maxrow) size of the list box
+        @return (tuple): first row shown, number of rows shown, total number of rows
+        """
+        maxcol, maxrow = size
+        metrics = self.getMetrics(maxcol)
+        middle = self.calculate_visible(size, focus)[0]
+        if middle is None:
+            return 0, maxrow, metrics.total
+        offset_inset, focus_position = middle[0], middle[2]
+        top = metrics.offset(focus_position) - offset_inset
+        return max(0, top), maxrow, metrics.total
+
+    def jumpToRow(self, size, row):
+        """Scroll the list box so the given row is at the top, and focus the widget shown there
+
+        @param size(tuple): (maxcol, maxrow) size of the list box
+        @param row(int): row from the top of the list
+        """
+        metrics = self.getMetrics(size[0])
+        if not metrics.total:
+            return
+        row = max(0, min(row, metrics.total - 1))
+        position = metrics.find(row)
+        self.change_focus(size, position, offset_inset=metrics.offset(position) - row)
+
+
+class ScrollBar(urwid.Widget):
+    """Box widget showing an UnselectableListBox with a scroll bar on its right side"""
+    _sizing = frozenset(['box'])
+    thumb_char = '█'
+    trough_char = '│'
+
+    def __init__(self, list_box):
+        """
+        @param list_box(UnselectableListBox): list box to show
+        """
+        self.list_box = list_box
+
+    def selectable(self):
+        return self.list_box.selectable()
+
+    def _listSize(self, size):
+        maxcol, maxrow = size
+        return (max(1, maxcol - 1), maxrow)
+
+    def getBarRows(self, size, focus=False):
+        """Return the first row and the height of the thumb
+
+        @param size(tuple): (maxcol, maxrow) size of the widget
+        @return (tuple): first row of the thumb and its height, height is 0 if
+            everything is visible
+        """
+        maxrow = size[1]
+        top, shown, total = self.list_box.getScrollPosition(self._listSize(size), focus)
+        if total <= shown or not maxrow:
+            return 0, 0
+        height = max(1, shown * maxrow // total)
+        start = min(top * maxrow // total, maxrow - height)
+        return start, height
+
+    def render(self, size, focus=False):
+        maxcol, maxrow = size
+        list_size = self._listSize(size)
+        list_canvas = self.list_box.render(list_size, focus)
+        start, height = self.getBarRows(size, focus)
+        chars = [self.thumb_char if start <= row < start + height else self.trough_char for row in range(maxrow)]
+        bar_canvas = urwid.Text('\n'.join(chars)).render((1,))
+        return urwid.CanvasJoin([(list_canvas, None, focus, list_size[0]), (bar_canvas, None, False, 1)])
+
+    def keypress(self, size, key):
+        return self.list_box.keypress(self._listSize(size), key)
+
+    def get_cursor_coords(self, size):
+        return self.list_box.get_cursor_coords(self._listSize(size))
+
+    def mouse_event(self, size, event, button, col, row, focus):
+        list_size = self._listSize(size)
+        if col < list_size[0]:
+            return self.list_box.mouse_event(list_size, event, button, col, row, focus)
+        if is_mouse_press(event) and button == 1:
+            top, shown, total = self.list_box.getScrollPosition(list_size, focus)
+            self.list_box.jumpToRow(list_size, row * total // size[1])
+            self._invalidate()
+            return True
+        return False
 
 
 class SimpleListWalkerWithCb(urwid.SimpleListWalker):
-    """a SimpleListWalker which call callbacks on items changes"""
+    """a SimpleListWalker which call callbacks on items changes
 
-    def __init__(self, contents, on_new=None, on_delete=None):
+    Changes done inside a bulkUpdate block are notified when the outermost block
+    ends, and the "modified" signal is then emitted only once. Items which are
+    deleted then added back in the same block (i.e. moved) are not notified.
+    Each change done outside of a block is a block by itself.
+    """
+
+    def __init__(self, contents, on_new=None, on_delete=None, on_batch=None):
         """
         @param contents: list to copy into this object
         @param on_new: callback to call when an item is added
         @param on_delete: callback to call when an item is deleted
+        @param on_batch: callback to call with the list of added items and the list
+            of deleted items at the end of a block. If set, on_new and on_delete
+            are not used.
         """
         # XXX: we can't use modified signal as it doesn't return the modified item
-        super(SimpleListWalkerWithCb, self).__init__(contents)
-        for content in contents:
-            on_new(content)
         self._on_new = on_new
         self._on_delete = on_delete
+        self._on_batch = on_batch
+        self._batch_level = 0
+        self._batch_new = []
+        self._batch_deleted = []
+        self._batch_modified = False
+        super(SimpleListWalkerWithCb, self).__init__(contents)
+        self._batch_new.extend(contents)
+        self._flush()
 
-    def __cbSingle(self, item, cb):
+    @contextlib.contextmanager
+    def bulkUpdate(self):
+        """Context manager grouping changes, see class docstring"""
+        self._batch_level += 1
         try:
-            cb(item)
-        except TypeError:
-            pass
+            yield self
+        finally:
+            self._batch_level -= 1
+            if not self._batch_level:
+                self._flush()
 
-    def __cbMulti(self, items, cb):
-        if cb is not None:
-            for item in items:
-                    cb(item)
+    @staticmethod
+    def _withoutMoved(items, moved):
+        """Return items which are not in moved
 
-    def __add__(self, new_list):
-        self.__cbMulti(new_list, self._on_new)
-        return super(SimpleListWalkerWithCb, self).__add__(new_list)
+        @param items(list): added or deleted items
+        @param moved(collections.Counter): id of moved items => count, will be modified
+        """
+        result = []
+        for item in items:
+            if moved[id(item)] > 0:
+                moved[id(item)] -= 1
+            else:
+                result.append(item)
+        return result
 
-    def __delitem__(self, item):
-        self.__cbSingle(item, self._on_delete)
-        return super(SimpleListWalkerWithCb, self).__delitem__(item)
+    def _flush(self):
+        """Call the callbacks and emit "modified" for the changes of the ended block"""
+        new, deleted = self._batch_new, self._batch_deleted
+        self._batch_new, self._batch_deleted = [], []
+        if new and deleted:
+            moved = collections.Counter(map(id, new)) & collections.Counter(map(id, deleted))
+            if moved:
+                new = self._withoutMoved(new, moved.copy())
+                deleted = self._withoutMoved(deleted, moved)
+        if new or deleted:
+            if self._on_batch is not None:
+                self._on_batch(new, deleted)
+            else:
+                if self._on_delete is not None:
+                    for item in deleted:
+                        self._on_delete(item)
+                if self._on_new is not None:
+                    for item in new:
+                        self._on_new(item)
+        if self._batch_modified:
+            self._batch_modified = False
+            super(SimpleListWalkerWithCb, self)._modified()
+
+    def _modified(self):
+        if self._batch_level:
+            self._batch_modified = True
+        else:
+            super(SimpleListWalkerWithCb, self)._modified()
 
-    def __delslice__(self, i,j):
-        items = super(SimpleListWalkerWithCb, self).__getslice__(i,j)
-        self.__cbMulti(items, self._on_delete)
-        return super(SimpleListWalkerWithCb, self).__delslice(i,j)
+    def __delitem__(self, i):
+        parent = super(SimpleListWalkerWithCb, self)
+        with self.bulkUpdate():
+            items = parent.__getitem__(i)
+            self._batch_deleted.extend(items if isinstance(i, slice) else [items])
+            return parent.__delitem__(i)
 
     def __iadd__(self, y):
         raise NotImplementedError
@@ -512,46 +912,609 @@ class SimpleListWalkerWithCb(urwid.SimpleListWalker):
 
     def __setitem__(self, i, y):
         parent = super(SimpleListWalkerWithCb, self)
-        self.__cbSingle(y, self._on_new)
-        to_delete = parent.__getitem__(i)
-        self.__cbSingle(to_delete, self._on_delete)
-        return parent.__setitem__(self, i, y)
-
-    def __setslice__(self, i, j, y):
-        parent = super(SimpleListWalkerWithCb, self)
-        items_to_delete = parent.__getslice__(i,j)
-        self.__cbMulti(items_to_delete, self._on_delete)
-        if hasattr(y, '__iter__'):
-            self.__cbMulti(y, self._on_new)
-        else:
-            self.__cbSingle(y, self._on_new)
-        return parent.__setslice__(i, j, y)
+        with self.bulkUpdate():
+            if isinstance(i, slice):
+                y = list(y)
+                self._batch_deleted.extend(parent.__getitem__(i))
+                self._batch_new.extend(y)
+            else:
+                self._batch_deleted.append(parent.__getitem__(i))
+                self._batch_new.append(y)
+            return parent.__setitem__(i, y)
 
     def append(self, obj):
-        self.__cbSingle(obj, self._on_new)
-        return super(SimpleListWalkerWithCb, self).append(obj)
+        with self.bulkUpdate():
+            self._batch_new.append(obj)
+            return super(SimpleListWalkerWithCb, self).append(obj)
 
     def extend(self, it):
-        self.__cbMulti(it, self.__on_new)
-        return super(SimpleListWalkerWithCb, self).extend(it)
+        it = list(it)
+        with self.bulkUpdate():
+            self._batch_new.extend(it)
+            return super(SimpleListWalkerWithCb, self).extend(it)
 
     def insert(self, idx, obj):
-        self.__cbSingle(obj, self.__on_new)
-        return super(SimpleListWalkerWithCb, self).insert(idx, obj)
+        with self.bulkUpdate():
+            self._batch_new.append(obj)
+            return super(SimpleListWalkerWithCb, self).insert(idx, obj)
 
     def pop(self, idx=None):
         if idx is None:
             idx=len(self)-1
+        with self.bulkUpdate():
+            item = super(SimpleListWalkerWithCb, self).pop(idx)
+            self._batch_deleted.append(item)
+            return item
 
-        parent = super(SimpleListWalkerWithCb, self)
-        to_remove = parent.__getitem__(idx)
-        self.__cbSingle(to_remove, self._on_delete)
-        return parent.pop(idx)
+    def remove(self, val):
+        del self[self.index(val)]
+
+    def clear(self):
+        del self[:]
+
+
+class PositionsListWalker(urwid.SimpleListWalker):
+    """a SimpleListWalker which tells where its items changed
+
+    "modified" signal is also emitted on focus changes, so a "contents_change"
+    signal is emitted after each change of the items, with the position of the
+    first changed item, the number of items removed there and the number of
+    items added instead.
+    """
+    signals = ['modified', 'contents_change']
+
+    def _changed(self, start, removed, added):
+        urwid.emit_signal(self, 'contents_change', start, removed, added)
+
+    def _insertPosition(self, idx, length):
+        """Return the position of an insertion index, as list.insert does"""
+        if idx < 0:
+            idx += length
+        return min(max(idx, 0), length)
+
+    def __delitem__(self, i):
+        length = len(self)
+        super(PositionsListWalker, self).__delitem__(i)
+        if isinstance(i, slice):
+            start, stop, step = i.indices(length)
+            if step != 1:
+                self._changed(0, length, len(self))
+            elif stop > start:
+                self._changed(start, stop - start, 0)
+        else:
+            self._changed(i + length if i < 0 else i, 1, 0)
+
+    def __setitem__(self, i, y):
+        length = len(self)
+        if isinstance(i, slice):
+            y = list(y)
+            super(PositionsListWalker, self).__setitem__(i, y)
+            start, stop, step = i.indices(length)
+            if step != 1:
+                self._changed(0, length, len(self))
+            else:
+                self._changed(start, max(stop - start, 0), len(y))
+        else:
+            super(PositionsListWalker, self).__setitem__(i, y)
+            self._changed(i + length if i < 0 else i, 1, 1)
+
+    def __iadd__(self, y):
+        self.extend(y)
+        return self
+
+    def __imul__(self, n):
+        length = len(self)
+        super(PositionsListWalker, self).__imul__(n)
+        self._changed(0, length, len(self))
+        return self
+
+    def append(self, obj):
+        super(PositionsListWalker, self).append(obj)
+        self._changed(len(self) - 1, 0, 1)
+
+    def extend(self, it):
+        it = list(it)
+        length = len(self)
+        super(PositionsListWalker, self).extend(it)
+        self._changed(length, 0, len(it))
+
+    def insert(self, idx, obj):
+        start = self._insertPosition(idx, len(self))
+        super(PositionsListWalker, self).insert(idx, obj)
+        self._changed(start, 0, 1)
+
+    def pop(self, idx=-1):
+        length = len(self)
+        item = super(PositionsListWalker, self).pop(idx)
+        self._changed(idx + length if idx < 0 else idx, 1, 0)
+        return item
 
     def remove(self, val):
-        ret = super(SimpleListWalkerWithCb, self).remove(val)
-        self.__cbSingle(val, self._on_delete)
-        return ret
+        del self[self.index(val)]
+
+    def reverse(self):
+        super(PositionsListWalker, self).reverse()
+        self._changed(0, len(self), len(self))
+
+    def sort(self, **kwargs):
+        super(PositionsListWalker, self).sort(**kwargs)
+        self._changed(0, len(self), len(self))
+
+    def clear(self):
+        del self[:]
+
+
+class OptionsWalker(urwid.ListWalker):
+    """ListWalker which keeps options as plain data and builds widgets only for shown rows
+
+    Options are kept as a list of values, a list of labels (which are the same
+    objects as values for simple string options) and a bytearray of selection states.
+    Widgets are built with option_type when a row is needed, and widgets of rows
+    which are not used anymore are recycled if they have a "recycle" method.
+    /!\ widgets are only valid while their row is in the cache, so cache_size must
+        be greater than the number of rows which can be shown at once
+    """
+    cache_size = 256
+
+    def __init__(self, option_type, align='left', on_new=None):
+        """
+        @param option_type: callable (usually a class) called to build a widget,
+            as in GenericList
+        @param align: alignement of text inside the widgets
+        @param on_new: callback to call with each newly built widget
+        """
+        self._option_type = option_type
+        self._align = align
+        self._on_new = on_new
+        self.values = []
+        self.labels = []
+        self.selected = bytearray()
+        self._widgets = collections.OrderedDict() # position => widget, for rows built recently
+        self._positions = {} # widget => position, for widgets in cache
+        self._pool = [] # widgets which can be recycled
+        self._index = None # value => positions, built when needed
+        self.focus = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, position):
+        if position < 0:
+            raise IndexError(position)
+        try:
+            widget = self._widgets[position]
+        except KeyError:
+            widget = self._buildWidget(self.getOption(position), bool(self.selected[position]))
+            self._widgets[position] = widget
+            self._positions[widget] = position
+            if len(self._widgets) > self.cache_size:
+                self._releaseWidget(*self._widgets.popitem(last=False))
+        else:
+            self._widgets.move_to_end(position)
+        return widget
+
+    def _buildWidget(self, option, selected):
+        if self._pool:
+            widget = self._pool.pop()
+            widget.recycle(option, selected)
+            return widget
+        widget = self._option_type(option, align=self._align)
+        if selected:
+            widget.setState(True, invisible=True)
+        if self._on_new is not None:
+            self._on_new(widget)
+        return widget
+
+    def _releaseWidget(self, position, widget):
+        del self._positions[widget]
+        if hasattr(widget, 'recycle'):
+            self._pool.append(widget)
+
+    def _releaseAll(self):
+        """Release all built widgets, must be called when positions change"""
+        for position, widget in self._widgets.items():
+            self._releaseWidget(position, widget)
+        self._widgets.clear()
+        self._index = None
+
+    def getPosition(self, widget):
+        """Return the position of a built widget, or None if it is not used anymore"""
+        return self._positions.get(widget)
+
+    @staticmethod
+    def splitOptions(options):
+        """Split options in values and labels
+
+        @param options: list of options, as for GenericList
+        @return (tuple): list of values and list of labels
+        """
+        values = []
+        labels = []
+        for option in options:
+            if isinstance(option, ListOption):
+                label = str(option)
+                # the value is only stored when it differs from the label
+                values.append(getattr(option, '_value', label))
+                labels.append(label)
+            elif isinstance(option, str):
+                values.append(option)
+                labels.append(option)
+            elif isinstance(option, tuple) and len(option) == 2:
+                value, label = option
+                values.append(value)
+                labels.append(label or value)
+            else:
+                raise NotImplementedError
+        return values, labels
+
+    def getLabel(self, position):
+        """Return the label of the option at the given position"""
+        return str(self.labels[position])
+
+    def getOption(self, position):
+        """Return the option at the given position as a ListOption"""
+        value = self.values[position]
+        label = self.labels[position]
+        return ListOption(label if label is value else (value, label))
+
+    def getOptions(self, positions=None):
+        """Return options as ListOption
+
+        @param positions(iterable, None): positions of the options, or None for all
+        @return (list[ListOption]): options
+        """
+        if positions is None:
+            positions = range(len(self.values))
+        return [self.getOption(position) for position in positions]
+
+    def findPositions(self, key):
+        """Return the positions of the options with the given value
+
+        @param key: value of the options
+        @return (list): positions, in order
+        """
+        values = self.values
+        if self._index is None:
+            # the first position is kept for each value
+            self._index = dict(zip(reversed(values), range(len(values) - 1, -1, -1)))
+        first = self._index.get(key)
+        if first is None:
+            return []
+        if len(self._index) == len(values):
+            return [first]
+        return [position for position in range(first, len(values)) if values[position] == key]
+
+    def selectedPositions(self):
+        """Iterate positions of selected options, in order"""
+        selected = self.selected
+        position = selected.find(1)
+        while position != -1:
+            yield position
+            position = selected.find(1, position + 1)
+
+    def setSelected(self, position, selected):
+        """Change selection state of an option without emitting any signal"""
+        self.selected[position] = selected
+        widget = self._widgets.get(position)
+        if widget is not None and widget.getState() != selected:
+            widget.setState(selected, invisible=True)
+
+    def unselectAll(self, invisible=False):
+        for position in list(self.selectedPositions()):
+            widget = self._widgets.get(position)
+            if widget is None:
+                self.selected[position] = 0
+                continue
+            if widget.getState():
+                widget.setState(False, invisible)
+                widget._invalidate()
+            self.selected[position] = widget.getState()
+
+    def setOptions(self, values, labels, selected=None, focus=0):
+        """Replace all options
+
+        @param values(list): values of the new options
+        @param labels(list): labels of the new options, as returned by splitOptions
+        @param selected(bytearray, None): selection state of each option
+        @param focus(int): position of the focused option
+        """
+        self._releaseAll()
+        self.values = values
+        self.labels = labels
+        self.selected = selected if selected is not None else bytearray(len(values))
+        self.focus = focus if 0 <= focus < len(values) else 0
+        self._modified()
+
+    def delete(self, position):
+        """Delete the option at the given position"""
+        del self.values[position]
+        del self.labels[position]
+        del self.selected[position]
+        self._releaseAll()
+        if self.focus > position or self.focus >= len(self.values):
+            self.focus = max(0, self.focus - 1)
+        self._modified()
+
+    def get_focus(self):
+        if not self.values:
+            return None, None
+        return self[self.focus], self.focus
+
+    def set_focus(self, position):
+        if not 0 <= position < len(self.values):
+            raise IndexError(position)
+        self.focus = position
+        self._modified()
+
+    def next_position(self, position):
+        if position >= len(self.values) - 1:
+            raise IndexError(position)
+        return position + 1
+
+    def prev_position(self, position):
+        if position <= 0:
+            raise IndexError(position)
+        return position - 1
+
+    def positions(self, reverse=False):
+        if reverse:
+            return range(len(self.values) - 1, -1, -1)
+        return range(len(self.values))
+
+
+class ListView(urwid.ListWalker):
+    """ListWalker showing a filtered and sorted view of an other list walker
+
+    The view is a list of positions of the underlying walker, nothing is copied.
+    When the filter query is extended (e.g. when a character is typed), only the
+    current matches are checked again.
+    """
+
+    def __init__(self, walker, get_option, get_label):
+        """
+        @param walker: underlying list walker, must emit "modified" when changed
+        @param get_option: callable returning the option (ListOption) at a position
+            of the underlying walker
+        @param get_label: callable returning the label (str) at a position of the
+            underlying walker
+        """
+        self._walker = walker
+        self._get_option = get_option
+        self._get_label = get_label
+        self._query = None
+        self._predicate = None
+        self._sort_key = None
+        self._reverse = False
+        self._labels = None # lower case labels, built when needed
+        self._keys = None # sort keys, built when needed
+        self._order = None # sorted positions, None for the natural order
+        self._positions = [] # shown positions of the underlying walker
+        self._dirty = True
+        self.focus = 0
+        urwid.connect_signal(walker, 'modified', self._onWalkerModified)
+
+    def _onWalkerModified(self):
+        self._dirty = True
+        self._modified()
+
+    def _update(self):
+        """Compute the view again if the underlying walker has been modified"""
+        if not self._dirty:
+            return
+        focus_position = self._positions[self.focus] if self._positions else None
+        self._dirty = False
+        self._labels = None
+        self._keys = None
+        self._sort()
+        self._positions = self._filter(self._getOrder())
+        self.setBaseFocus(focus_position)
+
+    def setBaseFocus(self, position):
+        """Set focus on a position of the underlying walker, or on the first row if it is not shown"""
+        focus = self.fromBase(position) if position is not None else None
+        self.focus = focus or 0
+
+    def _getOrder(self):
+        if self._order is not None:
+            return self._order
+        length = len(self._walker)
+        return range(length - 1, -1, -1) if self._reverse else range(length)
+
+    def _getLabels(self):
+        if self._labels is None:
+            self._labels = [self._get_label(position).lower() for position in range(len(self._walker))]
+        return self._labels
+
+    def _sortKey(self, position):
+        return self._keys[position] if self._keys is not None else position
+
+    def _sort(self):
+        if self._sort_key is None:
+            self._keys = None
+            self._order = None
+            return
+        get_option = self._get_option
+        self._keys = [self._sort_key(get_option(position)) for position in range(len(self._walker))]
+        self._order = sorted(range(len(self._walker)), key=self._keys.__getitem__, reverse=self._reverse)
+
+    def _filter(self, positions):
+        if self._query:
+            query = self._query
+            labels = self._getLabels()
+            positions = [position for position in positions if query in labels[position]]
+        if self._predicate is not None:
+            predicate = self._predicate
+            get_option = self._get_option
+            positions = [position for position in positions if predicate(get_option(position))]
+        return list(positions)
+
+    def _matches(self, position):
+        if self._query and self._query not in self._getLabels()[position]:
+            return False
+        return self._predicate is None or bool(self._predicate(self._get_option(position)))
+
+    def _insertionIndex(self, positions, position):
+        """Return the index where position must be inserted in sorted positions"""
+        key = self._sortKey(position)
+        low, high = 0, len(positions)
+        while low < high:
+            middle = (low + high) // 2
+            middle_key = self._sortKey(positions[middle])
+            if (middle_key >= key) if self._reverse else (middle_key <= key):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def isActive(self):
+        """Return True if the view filters or sorts the underlying walker"""
+        return bool(self._query or self._predicate is not None or self._sort_key is not None or self._reverse)
+
+    def setFilter(self, query=None, predicate=None):
+        """Change the filter of the view
+
+        @param query(unicode, None): only show options with this text in their label
+            (case insensitive)
+        @param predicate(callable, None): only show options for which this callable,
+            called with the option (ListOption), returns True
+        """
+        query = query.lower() if query else None
+        narrow = (not self._dirty and predicate is self._predicate
+                  and query is not None and self._query is not None and self._query in query)
+        self._query = query
+        self._predicate = predicate
+        if self._dirty:
+            self._update()
+            return
+        focus_position = self._positions[self.focus] if self._positions else None
+        self._positions = self._filter(self._positions if narrow else self._getOrder())
+        self.setBaseFocus(focus_position)
+        self._modified()
+
+    def setSort(self, key=None, reverse=False):
+        """Change the sort of the view
+
+        @param key(callable, None): callable returning the sort key of an option
+            (ListOption), or None to keep the order of the underlying walker
+        @param reverse(bool): True to reverse the order
+        """
+        self._sort_key = key
+        self._reverse = reverse
+        if self._dirty:
+            self._update()
+            return
+        focus_position = self._positions[self.focus] if self._positions else None
+        self._sort()
+        self._positions = self._filter(self._getOrder())
+        self.setBaseFocus(focus_position)
+        self._modified()
+
+    def refreshOption(self, position):
+        """Update the view after a change of the label or value of one option
+
+        @param position(int): position of the option in the underlying walker
+        """
+        if self._dirty:
+            return
+        if self._labels is not None:
+            self._labels[position] = self._get_label(position).lower()
+        focus_position = self._positions[self.focus] if self._positions else None
+        if self._keys is not None:
+            self._order.remove(position)
+            self._keys[position] = self._sort_key(self._get_option(position))
+            self._order.insert(self._insertionIndex(self._order, position), position)
+        try:
+            self._positions.remove(position)
+        except ValueError:
+            pass
+        if self._matches(position):
+            self._positions.insert(self._insertionIndex(self._positions, position), position)
+        self.setBaseFocus(focus_position)
+        self._modified()
+
+    def toBase(self, position):
+        """Return the position in the underlying walker of a position of the view"""
+        self._update()
+        return self._positions[position]
+
+    def fromBase(self, position):
+        """Return the position in the view of a position of the underlying walker
+
+        @return (int, None): position, or None if the option is not shown
+        """
+        self._update()
+        try:
+            return self._positions.index(position)
+        except ValueError:
+            return None
+
+    def __len__(self):
+        self._update()
+        return len(self._positions)
+
+    def __getitem__(self, position):
+        self._update()
+        if position < 0:
+            raise IndexError(position)
+        return self._walker[self._positions[position]]
+
+    def get_focus(self):
+        self._update()
+        if not self._positions:
+            return None, None
+        return self[self.focus], self.focus
+
+    def set_focus(self, position):
+        self._update()
+        if not 0 <= position < len(self._positions):
+            raise IndexError(position)
+        self.focus = position
+        self._modified()
+
+    def next_position(self, position):
+        if position >= len(self) - 1:
+            raise IndexError(position)
+        return position + 1
+
+    def prev_position(self, position):
+        if position <= 0:
+            raise IndexError(position)
+        return position - 1
+
+    def positions(self, reverse=False):
+        length = len(self)
+        if reverse:
+            return range(length - 1, -1, -1)
+        return range(length)
+
+
+def longestIncreasing(pairs):
+    """Find the longest subsequence of pairs whose second items are increasing
+
+    this is done in O(n log n)
+    @param pairs(list): (new position, old position) tuples, sorted by new position
+    @return (list): (old position, new position) tuples of the subsequence, in order
+    """
+    tails = [] # tails[k]: smallest old position ending an increasing subsequence of length k+1
+    tails_idx = [] # index in pairs of tails items
+    previous = [] # index in pairs of the previous item in the subsequence
+    for idx, (new_position, old_position) in enumerate(pairs):
+        k = bisect.bisect_left(tails, old_position)
+        if k == len(tails):
+            tails.append(old_position)
+            tails_idx.append(idx)
+        else:
+            tails[k] = old_position
+            tails_idx[k] = idx
+        previous.append(tails_idx[k-1] if k else None)
+    subsequence = []
+    idx = tails_idx[-1] if tails_idx else None
+    while idx is not None:
+        new_position, old_position = pairs[idx]
+        subsequence.append((old_position, new_position))
+        idx = previous[idx]
+    subsequence.reverse()
+    return subsequence
 
 
 class GenericList(urwid.ListBox):
@@ -565,6 +1528,8 @@ class GenericList(urwid.ListBox):
             - 'single' if only one must be selected
             - 'no_first_select' nothing selected when list is first displayed
             - 'can_select_none' if we can select nothing
+            - 'virtual' to keep options as plain data and build widgets only
+              for shown rows (see OptionsWalker)
         @param align: alignement of text inside the list
         @param option_type: callable (usually a class) which will be called with:
             - option as first argument
@@ -578,6 +1543,7 @@ class GenericList(urwid.ListBox):
         self.single = 'single' in style
         self.no_first_select = 'no_first_select' in style
         self.can_select_none = 'can_select_none' in style
+        self.virtual = 'virtual' in style
         self.align = align
         self.option_type = option_type
         self.first_display = True
@@ -588,22 +1554,167 @@ class GenericList(urwid.ListBox):
         if on_change:
             urwid.connect_signal(self, 'change', on_change, user_data)
 
-        self.content = SimpleListWalkerWithCb([], self._addSignals, lambda widget: self._emit('change'))
+        self._widgets_by_value = {} # value => widgets with this value
+        self._selected = set() # selected widgets
+        self._positions = None # widget => position, built when needed
+        self._changing_values = False
+        self.content_version = 0 # incremented when options, their texts or their selection change
+        self.view = None # ListView used when options are filtered or sorted
+        if self.virtual:
+            self.content = OptionsWalker(option_type, align, self._addSignals)
+        else:
+            self.content = SimpleListWalkerWithCb([], on_batch=self._onWidgetsChange)
         super(GenericList, self).__init__(self.content)
         self.changeValues(options)
 
+    @staticmethod
+    def _valueKey(value):
+        """Return the key used to index a value"""
+        return value.value if isinstance(value, ListOption) else value
+
+    def _contentChanged(self, *args):
+        self.content_version += 1
+
+    def _onWidgetsChange(self, new, deleted):
+        self._contentChanged()
+        for widget in deleted:
+            self._unindexWidget(widget)
+        for widget in new:
+            self._indexWidget(widget)
+        self._positions = None
+        if deleted and not self._changing_values:
+            self._emit('change')
+
+    def _indexWidget(self, widget):
+        self._addSignals(widget)
+        self._widgets_by_value.setdefault(self._valueKey(widget.getValue()), []).append(widget)
+        if widget.getState():
+            self._selected.add(widget)
+
+    def _unindexWidget(self, widget):
+        self._removeSignals(widget)
+        key = self._valueKey(widget.getValue())
+        widgets = self._widgets_by_value.get(key, [])
+        try:
+            widgets.remove(widget)
+        except ValueError:
+            pass
+        if not widgets:
+            self._widgets_by_value.pop(key, None)
+        self._selected.discard(widget)
+
+    def _getPosition(self, widget):
+        """Return the position of a widget in the list"""
+        if self._positions is None:
+            self._positions = {wid: idx for idx, wid in enumerate(self.content)}
+        return self._positions[widget]
+
+    def _findWidget(self, value):
+        """Return the first widget with the given value, or None"""
+        widgets = self._widgets_by_value.get(self._valueKey(value))
+        if not widgets:
+            return None
+        if len(widgets) == 1:
+            return widgets[0]
+        return min(widgets, key=self._getPosition)
+
     def _addSignals(self, widget):
-        for signal, callback in (('change', self._onStateChange), ('click', self._onClick)):
+        for signal, callback in (('change', self._onStateChange), ('click', self._onClick), ('text_change', self._contentChanged)):
             try:
                 urwid.connect_signal(widget, signal, callback)
             except NameError:
                 pass #the widget given doesn't support the signal
 
+    def _removeSignals(self, widget):
+        urwid.disconnect_signal(widget, 'change', self._onStateChange)
+        urwid.disconnect_signal(widget, 'click', self._onClick)
+        urwid.disconnect_signal(widget, 'text_change', self._contentChanged)
+
     @property
     def contents(self):
         return self.content
 
+    def _getView(self):
+        if self.view is None:
+            content = self.content
+            if self.virtual:
+                get_option, get_label = content.getOption, content.getLabel
+            else:
+                get_option = lambda position: content[position].getValue()
+                get_label = lambda position: str(content[position].getValue())
+            self.view = ListView(content, get_option, get_label)
+            urwid.connect_signal(self.view, 'modified', self._invalidate)
+        return self.view
+
+    def _changeView(self, change_cb):
+        """Change the view with change_cb, and show it if it is active
+
+        @param change_cb(callable): called with the view
+        """
+        self._contentChanged()
+        view = self._getView()
+        if self.body is not view:
+            focus = self.content.get_focus()[1]
+            if focus is not None:
+                view.setBaseFocus(focus)
+        change_cb(view)
+        if view.isActive():
+            self.body = view
+        elif self.body is view:
+            if len(view):
+                self.content.set_focus(view.toBase(view.focus))
+            self.body = self.content
+        # positions shown have changed, a pending focus change is not valid anymore
+        focus = self.body.get_focus()[1]
+        if focus is not None:
+            self.set_focus(focus)
+
+    def _focusBase(self, position):
+        """Move the focus to a position of the underlying walker, if it is shown"""
+        if self.body is self.view:
+            position = self.view.fromBase(position)
+            if position is None:
+                return
+        self.focus_position = position
+
+    def setFilter(self, query=None, predicate=None):
+        """Only show some options, selection of hidden options is kept
+
+        @param query(unicode, None): only show options with this text in their label
+            (case insensitive)
+        @param predicate(callable, None): only show options for which this callable,
+            called with the option (ListOption), returns True
+        """
+        self._changeView(lambda view: view.setFilter(query, predicate))
+
+    def setSort(self, key=None, reverse=False):
+        """Show options in a different order, without changing the values
+
+        @param key(callable, None): callable returning the sort key of an option
+            (ListOption), or None to keep the order of values
+        @param reverse(bool): True to reverse the order
+        """
+        self._changeView(lambda view: view.setSort(key, reverse))
+
+    def refreshValue(self, value):
+        """Update filter and sort after the label of options with this value changed"""
+        self._contentChanged()
+        if self.view is None or self.body is not self.view:
+            return
+        if self.virtual:
+            positions = self.content.findPositions(self._valueKey(value))
+        else:
+            positions = [self._getPosition(widget) for widget in self._widgets_by_value.get(self._valueKey(value), ())]
+        for position in positions:
+            self.view.refreshOption(position)
+
     def _onStateChange(self, widget, selected, *args):
+        self._contentChanged()
+        if self.virtual:
+            position = self.content.getPosition(widget)
+            if position is None:
+                # the widget has been released, it doesn't show any option anymore
+                return
         if self.single:
             if not selected and not self.can_select_none:
                 #if in single mode, it's forbidden to unselect a value
@@ -612,28 +1723,50 @@ class GenericList(urwid.ListBox):
             if selected:
                 self.unselectAll(invisible=True)
                 widget.setState(True, invisible=True)
+        if self.virtual:
+            self.content.setSelected(position, widget.getState())
+        elif widget.getState():
+            self._selected.add(widget)
+        else:
+            self._selected.discard(widget)
         self._emit("change", widget, selected, *args)
 
     def _onClick(self, widget, *args):
-        if widget not in self.content:
+        if self.virtual:
+            if self.content.getPosition(widget) is not None:
+                self._emit("click", widget, *args)
+            return
+        if widget not in self._widgets_by_value.get(self._valueKey(widget.getValue()), ()):
             urwid.disconnect_signal(widget, "click", self._onClick)
             return
         self._emit("click", widget, *args)
 
     def unselectAll(self, invisible=False):
-        for widget in self.content:
+        self._contentChanged()
+        if self.virtual:
+            self.content.unselectAll(invisible)
+            return
+        for widget in list(self._selected):
             if widget.getState():
                 widget.setState(False, invisible)
                 widget._invalidate()
+            if not widget.getState():
+                self._selected.discard(widget)
 
     def deleteValue(self, value):
         """Delete the first value equal to the param given"""
-        for widget in self.content:
-            if widget.getValue() == value:
-                self.content.remove(widget)
-                self._emit('change')
-                return
-        raise ValueError("%s ==> %s" %  (str(value),str(self.content)))
+        if self.virtual:
+            positions = self.content.findPositions(self._valueKey(value))
+            if not positions:
+                raise ValueError("%s ==> %s" %  (str(value),str(self.content.values)))
+            self.content.delete(positions[0])
+            self._contentChanged()
+            self._emit('change')
+            return
+        widget = self._findWidget(value)
+        if widget is None:
+            raise ValueError("%s ==> %s" %  (str(value),str(self.content)))
+        self.content.remove(widget)
 
     def getSelectedValue(self):
         """Convenience method to get the value selected as a string in single mode, or None"""
@@ -642,32 +1775,109 @@ class GenericList(urwid.ListBox):
 
     def getAllValues(self):
         """Return values of all items"""
+        if self.virtual:
+            return self.content.getOptions()
         return [widget.getValue() for widget in self.content]
 
     def getSelectedValues(self):
         """Return values of selected items"""
-        result = []
-        for widget in self.content:
-            if widget.getState():
-                result.append(widget.getValue())
-        return result
+        if self.virtual:
+            return self.content.getOptions(self.content.selectedPositions())
+        return [widget.getValue() for widget in sorted(self._selected, key=self._getPosition)]
+
+    def changeValues(self, new_values, keyed=True):
+        """Change all values in one shot
+
+        @param new_values: list of options, as for the constructor
+        @param keyed(bool): if True, widgets of options still present (same value
+            and label) are kept with their selection state, only the needed
+            inserts, deletes and moves are applied, and the focused option keeps
+            the focus. If False, all widgets are rebuilt.
+            Ignored for virtual lists, where widgets are never kept.
+        """
+        if self.virtual:
+            self._setOptions(new_values)
+            self._contentChanged()
+        else:
+            self._changing_values = True
+            try:
+                self._setWidgets(ListOption.fromOptions(new_values), keyed)
+            finally:
+                self._changing_values = False
+        if self.first_display and self.single and new_values and not self.no_first_select:
+            self.content[0].setState(True)
+        self._emit('change')
+        self.first_display = False
 
-    def changeValues(self, new_values):
-        """Change all values in one shot"""
-        new_values = ListOption.fromOptions(new_values)
+    def _setOptions(self, options):
+        """Change options of a virtual list, keeping selection and focus of kept values"""
+        content = self.content
+        values, labels = content.splitOptions(options)
+        selected = bytearray(len(values))
+        focus = 0
+        if not self.first_display and content.values:
+            old_values = content.values
+            old_selected = set(old_values[position] for position in content.selectedPositions())
+            if old_selected:
+                for position, value in enumerate(values):
+                    if value in old_selected:
+                        selected[position] = 1
+            focus_key = old_values[content.focus]
+            focus = next((position for position, value in enumerate(values) if value == focus_key), 0)
+        content.setOptions(values, labels, selected, focus)
+
+    def _setWidgets(self, new_values, keyed):
+        """Change options of a list of widgets, see changeValues"""
         if not self.first_display:
-            old_selected = self.getSelectedValues()
+            old_selected = set(self._valueKey(widget.getValue()) for widget in self._selected)
         widgets = []
+        reused = set()
         for option in new_values:
-            widget = self.option_type(option, align=self.align)
-            if not self.first_display and option in old_selected:
-                widget.setState(True)
+            key = self._valueKey(option)
+            widget = None
+            if keyed:
+                for candidate in self._widgets_by_value.get(key, ()):
+                    if candidate not in reused and str(candidate.getValue()) == str(option):
+                        widget = candidate
+                        reused.add(widget)
+                        break
+            if widget is None:
+                widget = self.option_type(option, align=self.align)
+                if not self.first_display and key in old_selected:
+                    widget.setState(True)
             widgets.append(widget)
-        self.content[:] = widgets
-        if self.first_display and self.single and new_values and not self.no_first_select:
-            self.content[0].setState(True)
-        self._emit('change')
-        self.first_display = False
+        if reused:
+            self._applyWidgets(widgets, reused)
+        else:
+            self.content[:] = widgets
+
+    def _applyWidgets(self, widgets, reused):
+        """Update the walker to widgets with the minimal set of changes
+
+        @param widgets(list): widgets to show, in order
+        @param reused(set): widgets which are already in the list
+        """
+        content = self.content
+        focus_widget = content.get_focus()[0]
+        old_positions = {widget: position for position, widget in enumerate(content)}
+        # the longest run of kept widgets in the same order stay in place, the
+        # gaps between them are replaced
+        kept = [(position, old_positions[widget]) for position, widget in enumerate(widgets) if widget in reused]
+        anchors = longestIncreasing(kept)
+        anchors.append((len(content), len(widgets)))
+        gaps = []
+        old_start = new_start = 0
+        for old_position, new_position in anchors:
+            if old_start != old_position or new_start != new_position:
+                gaps.append((old_start, old_position, new_start, new_position))
+            old_start, new_start = old_position + 1, new_position + 1
+        # moved widgets are deleted then inserted in the same block, so they are
+        # not notified and stay indexed
+        with content.bulkUpdate():
+            for old_start, old_end, new_start, new_end in reversed(gaps):
+                content[old_start:old_end] = widgets[new_start:new_end]
+        if focus_widget in reused:
+            content.set_focus(self._getPosition(focus_widget))
 
     def selectValue(self, value, move_focus=True):
         """Select the first item which has the given value.
@@ -679,14 +1889,18 @@ class GenericList(urwid.ListBox):
 
         """
         self.unselectAll()
-        idx = 0
-        for widget in self.content:
-            if widget.getValue() == value:
-                widget.setState(True)
+        if self.virtual:
+            positions = self.content.findPositions(self._valueKey(value))
+            if positions:
+                self.content[positions[0]].setState(True)
                 if move_focus:
-                    self.focus_position = idx
-                return
-            idx+=1
+                    self._focusBase(positions[0])
+            return
+        widget = self._findWidget(value)
+        if widget is not None:
+            widget.setState(True)
+            if move_focus:
+                self._focusBase(self._getPosition(widget))
 
     def selectValues(self, values, move_focus=True):
         """Select all the given values.
@@ -700,14 +1914,29 @@ class GenericList(urwid.ListBox):
                 self.selectValue(values[-1], move_focus)
             return
         self.unselectAll()
+        if self.virtual:
+            # selection is changed silently, then through the last widget so
+            # "change" is only emitted once
+            last_position = None
+            for value in values:
+                for position in self.content.findPositions(self._valueKey(value)):
+                    self.content.setSelected(position, True)
+                    last_position = position
+            if last_position is not None:
+                self.content[last_position].setState(True)
+                if move_focus:
+                    self._focusBase(last_position)
+            return
+        last_widgets = None
         for value in values:
-            idx = 0
-            for widget in self.content:
-                if widget.getValue() == value:
-                    widget.setState(True)
-                    if move_focus:
-                        self.focus_position = idx
-                idx += 1
+            widgets = self._widgets_by_value.get(self._valueKey(value))
+            if not widgets:
+                continue
+            for widget in widgets:
+                widget.setState(True)
+            last_widgets = widgets
+        if move_focus and last_widgets:
+            self._focusBase(max(self._getPosition(widget) for widget in last_widgets))
 
 
 class List(urwid.Widget):
@@ -721,6 +1950,9 @@ class List(urwid.Widget):
         self.genericList = GenericList(options, style, align, option_type, on_click, on_change, user_data)
         urwid.connect_signal(self.genericList, 'change', lambda *args: self._emit('change'))
         self.max_height = max_height
+        self._heights = {} # (maxcol, focus, max_height) => height, for _heights_version
+        self._heights_version = None # genericList.content_version of cached heights
+        self._adapter = urwid.BoxAdapter(self.genericList, 1)
 
     @property
     def contents(self):
@@ -759,6 +1991,15 @@ class List(urwid.Widget):
     def selectValues(self, values, move_focus=True):
         return self.genericList.selectValues(values, move_focus)
 
+    def setFilter(self, query=None, predicate=None):
+        self.genericList.setFilter(query, predicate)
+
+    def setSort(self, key=None, reverse=False):
+        self.genericList.setSort(key, reverse)
+
+    def refreshValue(self, value):
+        self.genericList.refreshValue(value)
+
     def render(self, size, focus=False):
         return self.displayWidget(size, focus).render(size, focus)
 
@@ -766,12 +2007,27 @@ class List(urwid.Widget):
         return self.displayWidget(size, focus).rows(size, focus)
 
     def _getHeight(self, size, focus):
-        list_size = sum([wid.rows(size, focus) for wid in self.genericList.content])
-        height = min(list_size,self.max_height) or 1
+        # focus moves don't change the heights, only content changes do
+        version = self.genericList.content_version
+        if version != self._heights_version:
+            self._heights.clear()
+            self._heights_version = version
+        key = (size[0], focus, self.max_height)
+        try:
+            return self._heights[key]
+        except KeyError:
+            pass
+        list_size = 0
+        for wid in self.genericList.body:
+            list_size += wid.rows(size, focus)
+            if list_size >= self.max_height:
+                break
+        height = self._heights[key] = min(list_size,self.max_height) or 1
         return height
 
     def displayWidget(self, size, focus):
-        return urwid.BoxAdapter(self.genericList, self._getHeight(size, focus))
+        self._adapter.height = self._getHeight(size, focus)
+        return self._adapter
 
 
 ## MISC ##
@@ -905,6 +2161,7 @@ class MenuBox(urwid.WidgetWrap):
 
 
 class Menu(urwid.WidgetWrap):
+    signals = ['shortcuts_change']
 
     def __init__(self,loop, x_orig=0):
         """Menu widget
@@ -916,6 +2173,10 @@ class Menu(urwid.WidgetWrap):
         self.menu = {}
         self.x_orig = x_orig
         self.shortcuts = {} #keyboard shortcuts
+        self.shortcut_hits = collections.Counter() # shortcut => number of uses
+        self._callbacks = {} # category => {item: callback}
+        self._menu_boxes = {} # category => (MenuBox wrapped in AttrMap, width), built when needed
+        self._overlays = {} # category => (overlay, columns)
         self.save_bottom = None
         col_rol = ColumnsRoller()
         urwid.WidgetWrap.__init__(self, urwid.AttrMap(col_rol,'menubar'))
@@ -930,20 +2191,44 @@ class Menu(urwid.WidgetWrap):
     def setOrigX(self, orig_x):
         self.x_orig = orig_x
 
+    def _getMenuBox(self, menu_key):
+        """Return the MenuBox of a category, building it if needed
+
+        @param menu_key: name of the category
+        @return (tuple): MenuBox wrapped in an AttrMap, and its width
+        """
+        try:
+            return self._menu_boxes[menu_key]
+        except KeyError:
+            items = [item[0] for item in self.menu[menu_key]]
+            menu_box = MenuBox(self, items)
+            urwid.connect_signal(menu_box, 'click', self.onItemClick)
+            width = max((len(item) for item in items), default=0) + 2
+            self._menu_boxes[menu_key] = menu_box_data = (urwid.AttrMap(menu_box, 'menubar'), width)
+            return menu_box_data
+
     def __buildOverlay(self, menu_key, columns):
-        """Build the overlay menu which show menuitems
+        """Show the overlay menu with menuitems
+
+        The overlay is cached, and built again only if the category changes,
+        or if the bottom widget or the position are not the same
         @param menu_key: name of the category
         @param columns: column number where the menubox must be displayed"""
-        max_len = 0
-        for item in self.menu[menu_key]:
-            if len(item[0]) > max_len:
-                max_len = len(item[0])
-
         self.save_bottom = self.loop.widget
-        menu_box = MenuBox(self,[item[0] for item in self.menu[menu_key]])
-        urwid.connect_signal(menu_box, 'click', self.onItemClick)
-
-        self.loop.widget = urwid.Overlay(urwid.AttrMap(menu_box,'menubar'),self.save_bottom,('fixed left', columns),max_len+2,('fixed top',1),None)
+        try:
+            overlay, overlay_columns = self._overlays[menu_key]
+        except KeyError:
+            overlay = None
+        if overlay is None or overlay.bottom_w is not self.save_bottom or overlay_columns != columns:
+            menu_box, width = self._getMenuBox(menu_key)
+            overlay = urwid.Overlay(menu_box,self.save_bottom,('fixed left', columns),width,('fixed top',1),None)
+            self._overlays[menu_key] = (overlay, columns)
+        else:
+            # the menu is opened again, we start from first item
+            list_box = overlay.top_w.base_widget.listBox
+            if list_box.body:
+                list_box.set_focus(0)
+        self.loop.widget = overlay
 
     def keypress(self, size, key):
         if key == a_key['MENU_DOWN']:
@@ -956,10 +2241,13 @@ class Menu(urwid.WidgetWrap):
         return self._w.base_widget.keypress(size, key)
 
     def checkShortcuts(self, key):
-        for shortcut in list(self.shortcuts.keys()):
-            if key == shortcut:
-                category, item, callback = self.shortcuts[shortcut]
-                callback((category, item))
+        try:
+            category, item, callback = self.shortcuts[key]
+        except (KeyError, TypeError):
+            # TypeError: key is not hashable
+            return key
+        self.shortcut_hits[key] += 1
+        callback((category, item))
         return key
 
     def addMenu(self, category, item=None, callback=None, shortcut=None):
@@ -978,18 +2266,18 @@ class Menu(urwid.WidgetWrap):
         if not item:
             return
         self.menu[category].append((item, callback))
+        self._callbacks.setdefault(category, {}).setdefault(item, callback)
+        self._menu_boxes.pop(category, None)
+        self._overlays.pop(category, None)
         if shortcut:
-            assert(shortcut not in list(self.shortcuts.keys()))
+            assert(shortcut not in self.shortcuts)
             self.shortcuts[shortcut] = (category, item, callback)
+            self._emit('shortcuts_change')
 
     def onItemClick(self, widget):
         category = self._w.base_widget.getSelected().get_label()
         item = widget.getValue()
-        callback = None
-        for menu_item in self.menu[category]:
-            if item == menu_item[0]:
-                callback = menu_item[1]
-                break
+        callback = self._callbacks.get(category, {}).get(item)
         if callback:
             self.keypress(None, a_key['MENU_UP'])
             callback((category, item))
@@ -1012,6 +2300,9 @@ class MenuRoller(urwid.WidgetWrap):
         assert menus_list
         self.selected = None
         self.menu_items = collections.OrderedDict()
+        self._shortcuts = None # shortcut => menu items using it, built when needed
+        self._other_menus = [] # menu items without shortcuts dict, always checked
+        self._duplicates = {} # shortcut => names of menus using it
 
         self.columns = urwid.Columns([urwid.Text(''),urwid.Text('')])
         urwid.WidgetWrap.__init__(self, self.columns)
@@ -1046,19 +2337,20 @@ class MenuRoller(urwid.WidgetWrap):
         except ValueError:
             return super(MenuRoller, self).keypress(size, key)
 
-        if key==a_key['MENU_ROLLER_UP']:
+        action = a_key.get_action(key, 'menu_roller')
+        if action == 'MENU_ROLLER_UP':
             if self.columns.get_focus_column()==0:
                 if idx > 0:
                     self.selected = menu_ids[idx-1]
                     self._showSelected()
                 return
-        elif key==a_key['MENU_ROLLER_DOWN']:
+        elif action == 'MENU_ROLLER_DOWN':
             if self.columns.get_focus_column()==0:
                 if idx < len(menu_ids)-1:
                     self.selected = menu_ids[idx+1]
                     self._showSelected()
                 return
-        elif key==a_key['MENU_ROLLER_RIGHT']:
+        elif action == 'MENU_ROLLER_RIGHT':
             if self.columns.get_focus_column()==0 and \
                 (isinstance(self.columns.contents[1][0], urwid.Text) or \
                 self.menu_items[self.selected].widget.getMenuSize()==0):
@@ -1081,6 +2373,7 @@ class MenuRoller(urwid.WidgetWrap):
             if id_ in self.menu_items:
                 raise ValueError('Conflict: the id [{}] is already used'.format(id_))
             self.menu_items[id_] = MenuItem(name, widget)
+            self._watchShortcuts(widget)
         else:
             id_ = names[name]
             menu_item = self.menu_items[id_]
@@ -1100,13 +2393,13 @@ class MenuRoller(urwid.WidgetWrap):
         """
         assert menu_id is not None
         if menu_id in self.menu_items:
-            del self.menu_items[menu_id]
+            self._unwatchShortcuts(self.menu_items.pop(menu_id).widget)
         self.addMenu(name, widget, menu_id)
         if self.selected == menu_id:
             self._showSelected() #if we are on the menu, we update it
 
     def removeMenu(self, menu_id):
-        del self.menu_items[menu_id]
+        self._unwatchShortcuts(self.menu_items.pop(menu_id).widget)
         if self.selected == menu_id:
             try:
                 self.selected = next(iter(self.menu_items.keys()))
@@ -1114,8 +2407,79 @@ class MenuRoller(urwid.WidgetWrap):
                 self.selected = None
             self._showSelected()
 
+    def _watchShortcuts(self, widget):
+        self._shortcuts = None
+        try:
+            urwid.connect_signal(widget, 'shortcuts_change', self._onShortcutsChange)
+        except NameError:
+            pass # the widget doesn't tell when its shortcuts change
+
+    def _unwatchShortcuts(self, widget):
+        self._shortcuts = None
+        urwid.disconnect_signal(widget, 'shortcuts_change', self._onShortcutsChange)
+
+    def _onShortcutsChange(self, menu):
+        self._shortcuts = None
+
+    def _compileShortcuts(self):
+        """Build the shortcut => menu items table"""
+        shortcuts = {}
+        other_menus = []
+        for menu_item in self.menu_items.values():
+            try:
+                menu_shortcuts = menu_item.widget.shortcuts
+            except AttributeError:
+                other_menus.append(menu_item)
+                continue
+            for shortcut in menu_shortcuts:
+                shortcuts.setdefault(shortcut, []).append(menu_item)
+        self._duplicates = {shortcut: [menu_item.name for menu_item in menu_items]
+                            for shortcut, menu_items in shortcuts.items() if len(menu_items) > 1}
+        if other_menus:
+            # menus are checked in the same order as without the table
+            positions = {id(menu_item): idx for idx, menu_item in enumerate(self.menu_items.values())}
+            position = lambda menu_item: positions[id(menu_item)]
+            for shortcut, menu_items in shortcuts.items():
+                shortcuts[shortcut] = sorted(menu_items + other_menus, key=position)
+        self._shortcuts = shortcuts
+        self._other_menus = other_menus
+        for shortcut, menu_names in self._duplicates.items():
+            log.warning("shortcut {} is used in several menus: {}".format(shortcut, ', '.join(menu_names)))
+
+    def getDuplicateShortcuts(self):
+        """Return shortcuts used by several menus
+
+        @return (dict): shortcut => names of the menus using it
+        """
+        if self._shortcuts is None:
+            self._compileShortcuts()
+        return dict(self._duplicates)
+
+    def getShortcutHits(self):
+        """Return the number of uses of each shortcut, for all menus
+
+        @return (collections.Counter): shortcut => number of uses
+        """
+        hits = collections.Counter()
+        for menu_item in self.menu_items.values():
+            hits.update(getattr(menu_item.widget, 'shortcut_hits', {}))
+        return hits
+
     def checkShortcuts(self, key):
-        for menu_item in list(self.menu_items.values()):
+        """Call the menus using the key as a shortcut
+
+        this must be called with keys not handled by the focused widget (e.g. from
+        MainLoop's unhandled_input), so shortcuts don't take precedence over it
+        menus without shortcuts dict are also called, in the menus order
+        """
+        if self._shortcuts is None:
+            self._compileShortcuts()
+        try:
+            menu_items = self._shortcuts.get(key, self._other_menus)
+        except TypeError:
+            # key is not hashable
+            menu_items = self._other_menus
+        for menu_item in menu_items:
             key = menu_item.widget.checkShortcuts(key)
         return key
 
@@ -1141,7 +2505,7 @@ class GenericDialog(urwid.WidgetWrap):
             self.buttons['ok'] = urwid.Button(_("Ok"), kwargs.get('ok_cb'), kwargs.get('ok_value'))
         if self.buttons:
             buttons_flow = urwid.GridFlow(list(self.buttons.values()), max([len(button.get_label()) for button in self.buttons.values()])+4, 1, 1, 'center')
-        body_content = urwid.SimpleListWalker(widgets_lst)
+        body_content = PositionsListWalker(widgets_lst)
         frame_body = UnselectableListBox(body_content)
         frame = FocusFrame(frame_body, frame_header, buttons_flow if self.buttons else None, 'footer' if self.buttons else 'body')
         decorated_frame = urwid.LineBox(frame)
@@ -1342,7 +2706,7 @@ class FocusPile(urwid.Pile):
         if not ret:
             return
 
-        if key in FOCUS_KEYS:
+        if a_key.get_action(key, 'focus') in FOCUS_ACTIONS:
             direction, rotate = getFocusDirection(key, inversed = self._focus_inversed)
             max_pos = len(self.contents) - 1
             new_pos = self.focus_position + direction
@@ -1368,7 +2732,7 @@ class FocusFrame(urwid.Frame):
         if not ret:
             return
 
-        if key in FOCUS_KEYS:
+        if a_key.get_action(key, 'focus') in FOCUS_ACTIONS:
             direction, rotate = getFocusDirection(key)
 
             positions = [pos for pos in self.ordered_positions if pos in self]